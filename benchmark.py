@@ -0,0 +1,312 @@
+import io
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from core.gamestate import GameState
+from core.bitboard import BitboardGameState, move_to_positions
+from core.perft import perft
+from core.engine import Engine
+from core.smp import ParallelEngine
+from core.evaluation import evaluate, evaluate_with_pawns, full_evaluation
+from core.pawns import PawnTable
+from core.nnue import Network, check_accumulator
+from core.batch_evaluation import encode_positions, evaluate_batch
+from core.utils import detect_if_in_check
+from core.pgn import read_games, move_to_san, game_to_pgn
+
+
+# Cold import budget for the headless engine core, in milliseconds
+CORE_IMPORT_BUDGET_MS = 100
+CORE_MODULES = ('core.engine', 'core.perft', 'core.transposition')
+
+
+def cold_import_ms(modules=CORE_MODULES):
+    # Import time in a fresh interpreter, and whether pygame or NumPy got
+    # pulled in
+    code = ('import sys, time; start = time.perf_counter(); '
+            + ''.join(f'import {module}; ' for module in modules)
+            + "print((time.perf_counter() - start) * 1000, 'pygame' in sys.modules, "
+            "'numpy' in sys.modules)")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            check=True).stdout.split()
+    return float(output[0]), output[1] == 'True', output[2] == 'True'
+
+
+def count_moves_one_ply(gamestate):
+    # Same work Opponent.find_move does per node: generate every move for the
+    # side to play, make it and take it back.
+    n_moves = 0
+    for move in gamestate.generate_moves():
+        gamestate.move(*move_to_positions(move))
+        gamestate.unmake_move()
+        n_moves += 1
+    return n_moves
+
+
+def count_legal_moves_list_backend(gamestate):
+    # The only legality test the list backend has: play the move and ask
+    # detect_if_in_check, like Main.run does.
+    color = gamestate.current_turn_color
+    n_moves = 0
+    for move in gamestate.generate_moves():
+        gamestate.move(*move_to_positions(move))
+        if not detect_if_in_check(gamestate, color):
+            n_moves += 1
+        gamestate.unmake_move()
+    return n_moves
+
+
+def moves_per_second(duration=3.0):
+    gamestate = GameState()
+    n_moves = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        n_moves += count_moves_one_ply(gamestate)
+    return n_moves / (time.perf_counter() - start)
+
+
+def legal_moves_per_second_list_backend(duration=3.0):
+    gamestate = GameState()
+    n_moves = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        n_moves += count_legal_moves_list_backend(gamestate)
+    return n_moves / (time.perf_counter() - start)
+
+
+# Positions for the allocation count: the start, the Italian and Kiwipete
+ALLOCATION_FENS = (
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+)
+
+
+def allocations_per_position(fen, n=1000):
+    # tracemalloc's view of one list backend generate_moves(): peak bytes
+    # above the level before the call, and blocks still allocated after
+    # it. The first call allocates the ply's MoveBuffer, so it is left out.
+    gamestate = GameState.from_fen(fen)
+    gamestate.generate_moves()
+    tracemalloc.start()
+    try:
+        peak_bytes = 0
+        before = tracemalloc.take_snapshot()
+        for _ in range(n):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            gamestate.generate_moves()
+            peak_bytes += tracemalloc.get_traced_memory()[1] - current
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename')
+                 if stat.traceback[0].filename != tracemalloc.__file__)
+    return peak_bytes / n, max(blocks, 0) / n
+
+
+def perft_nodes_per_second(depth=4):
+    gamestate = BitboardGameState()
+    start = time.perf_counter()
+    nodes = perft(gamestate, depth)
+    return nodes / (time.perf_counter() - start)
+
+
+def check_detections_per_second(gamestate, n=100000):
+    start = time.perf_counter()
+    for _ in range(n):
+        detect_if_in_check(gamestate, 'w')
+    return n / (time.perf_counter() - start)
+
+
+def evaluations_per_second(function, n=100000):
+    gamestate = BitboardGameState()
+    start = time.perf_counter()
+    for _ in range(n):
+        function(gamestate)
+    return n / (time.perf_counter() - start)
+
+
+def game_positions(plies=80, seed=0):
+    # Positions along one random game, so pawn structures change as they
+    # would in play
+    rng = random.Random(seed)
+    gamestate = BitboardGameState()
+    positions = []
+    for _ in range(plies):
+        moves = gamestate.legal_moves()
+        if not moves:
+            break
+        gamestate.make_move(rng.choice(moves))
+        positions.append(BitboardGameState.from_fen(gamestate.to_fen()))
+    return positions
+
+
+def pawn_evaluations_per_second(pawn_table, n=100000):
+    # Evaluation with pawn terms from pawn_table, or recomputed when None
+    positions = game_positions()
+    start = time.perf_counter()
+    for i in range(n):
+        evaluate_with_pawns(positions[i % len(positions)], pawn_table)
+    return n / (time.perf_counter() - start)
+
+
+def nnue_evaluations_per_second(network, n=100000):
+    # Network evaluations from accumulators built beforehand, so only the
+    # dense layers are timed
+    positions = game_positions()
+    accumulators = [network.accumulator(gamestate).values for gamestate in positions]
+    start = time.perf_counter()
+    for i in range(n):
+        network.evaluate(accumulators[i % len(positions)], positions[i % len(positions)].side)
+    return n / (time.perf_counter() - start)
+
+
+def make_unmake_per_second(network=None, n=20000):
+    # Make and take back the first moves of the start position, with the
+    # accumulator of network kept up to date when one is given
+    gamestate = BitboardGameState()
+    moves = gamestate.legal_moves()[:5]
+    if network is not None:
+        gamestate.accumulator = network.accumulator(gamestate)
+    start = time.perf_counter()
+    for _ in range(n):
+        for move in moves:
+            gamestate.make_move(move)
+            gamestate.unmake_move()
+    return n * len(moves) / (time.perf_counter() - start)
+
+
+def check_accumulator_in_games(network, games=20, plies=120, seed=0):
+    # Random games with the accumulator checked against a full recompute
+    # after every move and every take back. Returns the positions checked.
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(games):
+        gamestate = BitboardGameState()
+        gamestate.accumulator = network.accumulator(gamestate)
+        for _ in range(plies):
+            moves = gamestate.legal_moves()
+            if not moves:
+                break
+            gamestate.make_move(rng.choice(moves))
+            check_accumulator(network, gamestate)
+            checked += 1
+        while gamestate.undo_stack:
+            gamestate.unmake_move()
+            check_accumulator(network, gamestate)
+            checked += 1
+    return checked
+
+
+def batch_evaluations_per_second(n=1000000):
+    boards, states = encode_positions([BitboardGameState()])
+    boards, states = np.repeat(boards, n, axis=0), np.repeat(states, n)
+    start = time.perf_counter()
+    evaluate_batch(boards, states)
+    return n / (time.perf_counter() - start)
+
+
+def search_stats(time_limit=5.0):
+    engine = Engine(time_limit=time_limit)
+    engine.search(BitboardGameState())
+    return engine
+
+
+def smp_scaling(depth=6, thread_counts=(1, 2, 4, 8)):
+    # Time to a fixed depth from the start position for each worker count,
+    # as (threads, seconds, nodes/s)
+    results = []
+    for threads in thread_counts:
+        engine = ParallelEngine(threads, time_limit=float('inf'), max_depth=depth)
+        # A depth 1 search first, so helper start-up is not timed
+        engine.max_depth = 1
+        engine.search(BitboardGameState())
+        engine.max_depth = depth
+        engine.tt.clear()
+
+        start = time.perf_counter()
+        engine.search(BitboardGameState())
+        elapsed = time.perf_counter() - start
+        results.append((threads, elapsed, engine.info.nodes / elapsed))
+        engine.close()
+    return results
+
+
+def random_pgn(games=200, max_plies=120, seed=0):
+    # Seeded random games written as PGN, for timing the reader
+    rng = random.Random(seed)
+    text = io.StringIO()
+    for index in range(games):
+        gamestate = BitboardGameState()
+        sans = []
+        for _ in range(max_plies):
+            moves = gamestate.legal_moves()
+            if not moves:
+                break
+            move = rng.choice(moves)
+            sans.append(move_to_san(gamestate, move))
+            gamestate.make_move(move)
+        text.write(game_to_pgn({'Event': 'Random', 'Round': str(index + 1)}, sans))
+    return text.getvalue()
+
+
+def pgn_games_per_second(games=200):
+    # Parsing and replaying the SAN of every move, without any search
+    text = random_pgn(games)
+    start = time.perf_counter()
+    plies = 0
+    for game in read_games(io.StringIO(text)):
+        for _ in game.replay():
+            plies += 1
+    elapsed = time.perf_counter() - start
+    return games / elapsed, plies / elapsed
+
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    import_ms, has_pygame, has_numpy = cold_import_ms()
+    print(f'core cold import: {import_ms:.0f}ms (budget {CORE_IMPORT_BUDGET_MS}ms'
+          f'{", OVER BUDGET" if import_ms > CORE_IMPORT_BUDGET_MS else ""}), '
+          f'pygame {"loaded" if has_pygame else "not loaded"}, '
+          f'numpy {"loaded" if has_numpy else "not loaded"}')
+    print(f'list backend, one ply make/take back: {moves_per_second(duration):.0f} moves/s')
+    list_rate = legal_moves_per_second_list_backend(duration)
+    print(f'list backend, legal moves: {list_rate:.0f} moves/s')
+    for fen in ALLOCATION_FENS:
+        peak_bytes, blocks = allocations_per_position(fen)
+        print(f'list backend, allocations per generated position ({fen.split()[0]}): '
+              f'{peak_bytes:.0f} bytes at peak, {blocks:.2f} blocks kept')
+    perft_rate = perft_nodes_per_second()
+    print(f'bitboard backend, perft(4): {perft_rate:.0f} nodes/s '
+          f'({perft_rate / list_rate:.0f}x)')
+    print(f'check detection: list backend {check_detections_per_second(GameState()):.0f}/s, '
+          f'bitboard backend {check_detections_per_second(BitboardGameState()):.0f}/s')
+    print(f'evaluation: incremental piece-square {evaluations_per_second(evaluate):.0f}/s, '
+          f'full recompute {evaluations_per_second(full_evaluation, 10000):.0f}/s')
+    cached, uncached = pawn_evaluations_per_second(PawnTable()), pawn_evaluations_per_second(None)
+    print(f'evaluation of game positions: pawn table {cached:.0f}/s, '
+          f'pawn structure recomputed {uncached:.0f}/s')
+    print(f'batch evaluation: {batch_evaluations_per_second():.0f} positions/s')
+    network = Network.random()
+    print(f'nnue: {nnue_evaluations_per_second(network):.0f} evaluations/s, make/unmake '
+          f'{make_unmake_per_second(network):.0f}/s with the accumulator and '
+          f'{make_unmake_per_second():.0f}/s without')
+    checked = check_accumulator_in_games(Network.random(scale=1000.0))
+    print(f'nnue accumulator with saturated int16 weights: {checked} positions match a '
+          f'full recompute')
+    engine = search_stats(duration)
+    info = engine.info
+    print(f'search, {duration:.0f}s from the start position: depth {info.depth}, '
+          f'{info.nodes} nodes, {info.nps:.0f} nodes/s')
+    print(f'transposition table: {engine.tt.stats()}')
+    print(f'pawn table: {engine.pawn_table.stats()}')
+    games_rate, plies_rate = pgn_games_per_second()
+    print(f'pgn replay: {games_rate:.0f} games/s, {plies_rate:.0f} moves/s')
+    for threads, elapsed, nps in smp_scaling():
+        print(f'lazy smp, {threads} workers: depth 6 in {elapsed:.2f}s, {nps:.0f} nodes/s')
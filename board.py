@@ -1,9 +1,6 @@
 import pygame
-import random
-import math
-import numpy as np
-from pieces import *
-from utils import opposite_color
+from sprites import get_sprite, load_sprites
+from utils import highlight_surface
 
 
 class Board():
@@ -15,109 +12,47 @@ class Board():
         self.board = pygame.transform.scale(self.board, (self.size, self.size))
         self.board.set_alpha(128)
 
-    def draw_gamestate(self, gamestate, screen):
+        # The checkerboard blended onto white never changes, so it is composed
+        # once and squares are restored from it
+        self.background = pygame.Surface((self.size, self.size)).convert()
+        self.background.fill('WHITE')
+        self.background.blit(self.board, (0, 0))
 
-        screen.fill('WHITE')
-        screen.blit(self.board, (0, 0))  # The chess checkerboard background
+        load_sprites()
 
-        for row_idx, row in enumerate(gamestate.position):
-            for rank_idx, piece in enumerate(row):
-                if piece is not None:
-                    screen.blit(piece.image, (rank_idx * self.offset, row_idx * self.offset))
-
-        pygame.display.update()
-
-
-class GameState():
-    def __init__(self):
-        # self.position = [
-        #     [Rook('b'), Knight('b'), Bishop('b'), Queen('b'), King('b'), Bishop('b'), Knight('b'), Rook('b')],
-        #     [Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b')],
-        #     [None, None, None, None, None, None, None, None],
-        #     [None, None, None, None, None, None, None, None],
-        #     [None, None, None, None, None, Queen('b'), None, None],
-        #     [None, None, None, None, None, None, None, None],
-        #     [Pawn('w'), Pawn('w'), Pawn('w'), None, Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w')],
-        #     [Rook('w'), Knight('w'), Bishop('w'), Queen('w'), King('w'), Bishop('w'), Knight('w'), Rook('w')],
-        # ]
-        self.position = [
-            [Rook('b'), Knight('b'), Bishop('b'), Queen('b'), King('b'), Bishop('b'), Knight('b'), Rook('b')],
-            [Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b')],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [None, None, None, None, None, None, None, None],
-            [Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w')],
-            [Rook('w'), Knight('w'), Bishop('w'), Queen('w'), King('w'), Bishop('w'), Knight('w'), Rook('w')],
-        ]
-
-        self.color_mask = []
-        for row in self.position:
-            row_ = []
-            for piece in row:
-                if not piece:
-                    row_.append(0)
-                elif piece.color == 'w':
-                    row_.append(1)
-                elif piece.color == 'b':
-                    row_.append(-1)
-            self.color_mask.append(row_)
-
-        self.color_mask = np.array(self.color_mask)
-
-        self.current_turn_color = 'w'
-
-        self.w_king_location = np.array([4, 7])
-        self.b_king_location = np.array([4, 0])
-
-    def get_king_location(self, color):
-        if color == 'w':
-            return self.w_king_location
-        elif color == 'b':
-            return self.b_king_location
+        # What is currently on screen per square: (color, char, highlighted)
+        self.drawn = [[None] * 8 for _ in range(8)]
 
-    def change_to_next_players_turn(self):
-        self.current_turn_color = opposite_color(self.current_turn_color)
+    def square_rect(self, x, y):
+        return pygame.Rect(x * self.offset, y * self.offset, self.offset, self.offset)
 
-    def get_piece_type(self, pos):
-        x, y = pos
-        return self.position[y][x]
+    def draw_square(self, screen, x, y, piece, highlighted):
+        rect = self.square_rect(x, y)
+        screen.blit(self.background, rect, rect)
+        if piece is not None:
+            screen.blit(get_sprite(piece.color, piece.char), rect)
+        if highlighted:
+            screen.blit(highlight_surface(rect.size), rect)
+        return rect
 
-    def update_position(self, piece, pos_from, pos_to):
-        # Update position
-        self.position[pos_from[1]][pos_from[0]] = None
-        self.position[pos_to[1]][pos_to[0]] = piece
+    def draw_gamestate(self, gamestate, screen, highlights=()):
+        # Only squares whose piece or highlight changed since the last call
+        # are redrawn and pushed to the display
+        highlights = {(int(x), int(y)) for x, y in highlights}
+        dirty = []
 
-        # Update color_mask
-        piece = self.color_mask[pos_from[1]][pos_from[0]]
-        self.color_mask[pos_from[1]][pos_from[0]] = 0
-        self.color_mask[pos_to[1]][pos_to[0]] = piece
-
-    def create_backup_position(self):
-        self.backup_position = []
-        for row in self.position:
-            new_row = []
-            for piece in row:
-                if piece is not None:
-                    new_row.append(piece.copy())
-                else:
-                    new_row.append(None)
-
-    def revert_position(self):
-        self.position = self.backup_position
-
-    def move(self, pos_from, pos_to):
-        self.create_backup_position()
-
-        piece = self.position[pos_from[1]][pos_from[0]]
-
-        if isinstance(piece, Pawn):
-            piece.has_moved = True
-
-        if isinstance(piece, King):
-            if piece.color == 'w':
-                self.w_king_location = np.array([pos_to[0], pos_to[1]])
-            elif piece.color == 'b':
-                self.b_king_location = np.array([pos_to[0], pos_to[1]])
-
-        self.update_position(piece, pos_from, pos_to)
+        for row_idx, row in enumerate(gamestate.position):
+            for rank_idx, piece in enumerate(row):
+                highlighted = (rank_idx, row_idx) in highlights
+                state = (None if piece is None else (piece.color, piece.char), highlighted)
+                if self.drawn[row_idx][rank_idx] != state:
+                    self.drawn[row_idx][rank_idx] = state
+                    dirty.append(self.draw_square(screen, rank_idx, row_idx, piece, highlighted))
+
+        if dirty:
+            pygame.display.update(dirty)
+        return dirty
+
+    def invalidate(self):
+        # Forces a full redraw on the next draw_gamestate call
+        self.drawn = [[None] * 8 for _ in range(8)]
@@ -0,0 +1,151 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+
+from core.engine import Engine, MATE, MAX_PLY
+from core.bitboard import move_to_uci
+from core.pgn import PgnGame, read_games, move_to_san
+
+# A move losing at least this many centipawns against the engine's choice
+# is reported as a blunder
+BLUNDER_THRESHOLD = 150
+# Scores are clipped here, so a missed mate counts as a large loss and not
+# as a mate-distance number
+SCORE_CLIP = 3000
+
+# Set in each worker process by _init_worker
+_engine = None
+
+
+def _init_worker(engine_options):
+    global _engine
+    _engine = Engine(**engine_options)
+
+
+def clip(score):
+    if abs(score) >= MATE - MAX_PLY:
+        return SCORE_CLIP if score > 0 else -SCORE_CLIP
+    return max(-SCORE_CLIP, min(SCORE_CLIP, score))
+
+
+def _search(gamestate):
+    # (best move, clipped score for the side to move, nodes)
+    if not gamestate.legal_moves():
+        return None, -SCORE_CLIP if gamestate.in_check() else 0, 0
+    best = _engine.search(gamestate)
+    return best, clip(_engine.info.score), _engine.info.nodes
+
+
+def analyze_game(task):
+    # Replays one game and searches every position from min_ply on. The
+    # search of the next position doubles as the score of the move played,
+    # so each position is searched once.
+    index, headers, movetext, min_ply, threshold = task
+    game = PgnGame(headers, movetext)
+    record = {
+        'game': index,
+        'white': headers.get('White', '?'),
+        'black': headers.get('Black', '?'),
+        'result': headers.get('Result', '*'),
+        'plies': 0,
+        'positions': 0,
+        'nodes': 0,
+        'blunders': [],
+    }
+
+    previous = None  # (ply, san, move played, best move, best san, best score)
+    gamestate = None
+    try:
+        for ply, (gamestate, move, san) in enumerate(game.replay()):
+            record['plies'] = ply + 1
+            if ply < min_ply:
+                continue
+            best, score, nodes = _search(gamestate)
+            _record_position(record, previous, score, nodes, threshold)
+            previous = (ply, san, move, best, move_to_san(gamestate, best), score)
+        if previous is not None:
+            # replay() has played the last move by now
+            _, score, nodes = _search(gamestate)
+            _record_position(record, previous, score, nodes, threshold)
+    except ValueError as error:
+        record['error'] = str(error)
+    return record
+
+
+def _record_position(record, previous, score, nodes, threshold):
+    record['positions'] += 1
+    record['nodes'] += nodes
+    if previous is None:
+        return
+    ply, san, played, best, best_san, best_score = previous
+    # score is from the opponent's side after the move played
+    loss = best_score + score
+    if played != best and loss >= threshold:
+        record['blunders'].append({
+            'ply': ply,
+            'move': san,
+            'best': best_san,
+            'best_uci': move_to_uci(best),
+            'loss': loss,
+        })
+
+
+def run_pipeline(path, output, processes=None, engine_options=None, min_ply=0,
+                 threshold=BLUNDER_THRESHOLD, limit=None):
+    # Reads games lazily and keeps at most a few per worker in flight, so
+    # memory does not depend on the size of the archive
+    processes = processes or multiprocessing.cpu_count()
+    window = processes * 2
+    games = positions = 0
+    start = time.perf_counter()
+    with open(path) as source, open(output, 'a') as sink, ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(engine_options or {},)) as pool:
+        pending = set()
+        for index, game in enumerate(read_games(source)):
+            if limit is not None and index >= limit:
+                break
+            pending.add(pool.submit(analyze_game, (index, game.headers, game.movetext,
+                                                   min_ply, threshold)))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    sink.write(json.dumps(record) + '\n')
+                    games += 1
+                    positions += record['positions']
+        for future in pending:
+            record = future.result()
+            sink.write(json.dumps(record) + '\n')
+            games += 1
+            positions += record['positions']
+    return games, positions, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find blunders in a PGN archive.')
+    parser.add_argument('pgn')
+    parser.add_argument('--output', default='analysis.jsonl',
+                        help='JSON lines file the results are appended to')
+    parser.add_argument('--processes', type=int, help='worker processes, default one per core')
+    parser.add_argument('--nodes', type=int, default=2000, help='search nodes per position')
+    parser.add_argument('--min-ply', type=int, default=16,
+                        help='positions before this ply are not searched')
+    parser.add_argument('--threshold', type=int, default=BLUNDER_THRESHOLD)
+    parser.add_argument('--limit', type=int, help='stop after this many games')
+    args = parser.parse_args(argv)
+
+    games, positions, elapsed = run_pipeline(
+        args.pgn, args.output, args.processes,
+        {'time_limit': float('inf'), 'node_limit': args.nodes}, args.min_ply,
+        args.threshold, args.limit)
+    print(f'{games} games, {positions} positions in {elapsed:.1f}s: '
+          f'{games / elapsed:.2f} games/s, {positions / elapsed:.0f} positions/s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
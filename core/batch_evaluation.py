@@ -0,0 +1,71 @@
+import numpy as np
+
+from core.bitboard import BitboardGameState
+from core.evaluation import MG_TABLE, EG_TABLE, PHASE, MAX_PHASE
+
+# A batch of N positions is an (N, 12) uint64 array of piece bitboards, in
+# BitboardGameState piece order, plus an (N,) uint16 array of packed state:
+# bit 0 side to play, bits 1-4 castling rights, bits 5-11 en passant
+# square + 1 (0 when there is none).
+
+# Columns: middlegame score, endgame score and phase, one row per (piece,
+# square) input. float32 keeps the matrix product on BLAS and is exact for
+# these magnitudes.
+WEIGHTS = np.stack([
+    np.array(MG_TABLE).ravel(),
+    np.array(EG_TABLE).ravel(),
+    np.repeat(PHASE, 64),
+], axis=1).astype(np.float32)
+
+# Rows unpacked at a time, to bound the (rows, 12, 64) bit array
+CHUNK_SIZE = 1 << 16
+
+
+def encode_positions(gamestates):
+    gamestates = list(gamestates)
+    boards = np.array([gamestate.pieces for gamestate in gamestates], dtype=np.uint64)
+    boards = boards.reshape(len(gamestates), 12)
+    states = np.array([
+        gamestate.side | (gamestate.castling << 1)
+        | ((0 if gamestate.ep_square is None else gamestate.ep_square + 1) << 5)
+        for gamestate in gamestates], dtype=np.uint16)
+    return boards, states
+
+
+def decode_positions(boards, states):
+    gamestates = []
+    for pieces, state in zip(boards.tolist(), states.tolist()):
+        gamestate = BitboardGameState.__new__(BitboardGameState)
+        ep_square = (state >> 5) - 1
+        gamestate.set_position(pieces, state & 1, (state >> 1) & 15,
+                               None if ep_square < 0 else ep_square)
+        gamestates.append(gamestate)
+    return gamestates
+
+
+def to_planes(boards):
+    # (N, 12) bitboards to (N, 12, 8, 8) 0/1 planes indexed [y][x]. Square
+    # sq is bit sq of the little-endian bytes.
+    bits = np.unpackbits(boards.astype('<u8').view(np.uint8), bitorder='little')
+    return bits.reshape(len(boards), 12, 8, 8)
+
+
+def _evaluate_planes(planes):
+    terms = (planes.reshape(len(planes), 768).astype(np.float32) @ WEIGHTS).astype(np.int64)
+    mg, eg, phase = terms[:, 0], terms[:, 1], np.minimum(terms[:, 2], MAX_PHASE)
+    return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+def evaluate_batch(positions, states=None):
+    # Tapered material and piece-square score for every position, from
+    # White's point of view, or from the side to play when states is given.
+    # Takes (N, 12) bitboards or (N, 12, 8, 8) planes.
+    if positions.ndim == 4:
+        scores = _evaluate_planes(positions)
+    else:
+        scores = np.concatenate([
+            _evaluate_planes(to_planes(positions[start:start + CHUNK_SIZE]))
+            for start in range(0, len(positions), CHUNK_SIZE)] or [np.zeros(0, np.int64)])
+    if states is not None:
+        scores = np.where(states & 1, -scores, scores)
+    return scores
@@ -0,0 +1,818 @@
+from core.zobrist import PIECE_KEYS, PAWN_KEYS, SIDE_KEY, CASTLING_KEYS, EP_FILE_KEYS
+from core.evaluation import MG_TABLE, EG_TABLE, PHASE
+
+# Squares are numbered y * 8 + x using the same (x, y) coordinates as the UI,
+# so a8 is square 0 and h1 is square 63. White pawns move towards square 0.
+
+WHITE, BLACK = 0, 1
+COLOR_CHARS = ('w', 'b')
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_CHARS = ('p', 'N', 'B', 'R', 'Q', 'K')
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+NOT_FILE_A = FULL ^ FILE_A
+NOT_FILE_H = FULL ^ FILE_H
+RANKS = [0xFF << (8 * y) for y in range(8)]
+
+BIT = [1 << sq for sq in range(64)]
+
+# Move encoding: 6 bits from square, 6 bits to square, 4 bits of flags.
+QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE = 0, 1, 2, 3
+CAPTURE, EP_CAPTURE = 4, 5
+PROMOTION = 8  # 8 + (promoted kind - KNIGHT), or'ed with CAPTURE for captures
+# a8 to a8, never a real move. Undo records of null moves hold it.
+NULL_MOVE = 0
+
+WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO = 1, 2, 4, 8
+
+E1, F1, G1, H1, D1, C1, B1, A1 = 60, 61, 62, 63, 59, 58, 57, 56
+E8, F8, G8, H8, D8, C8, B8, A8 = 4, 5, 6, 7, 3, 2, 1, 0
+
+# Castling rights that survive a move touching a given square
+CASTLE_MASK = [15] * 64
+CASTLE_MASK[E1] = 15 ^ (WHITE_OO | WHITE_OOO)
+CASTLE_MASK[H1] = 15 ^ WHITE_OO
+CASTLE_MASK[A1] = 15 ^ WHITE_OOO
+CASTLE_MASK[E8] = 15 ^ (BLACK_OO | BLACK_OOO)
+CASTLE_MASK[H8] = 15 ^ BLACK_OO
+CASTLE_MASK[A8] = 15 ^ BLACK_OOO
+
+
+FILES = 'abcdefgh'
+PROMOTION_CHARS = 'nbrq'
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+
+def square_name(sq):
+    return f'{FILES[sq & 7]}{8 - (sq >> 3)}'
+
+
+def parse_square(name):
+    return (8 - int(name[1])) * 8 + FILES.index(name[0])
+
+
+def encode_move(from_sq, to_sq, flag=QUIET):
+    return from_sq | (to_sq << 6) | (flag << 12)
+
+
+def move_from(move):
+    return move & 63
+
+
+def move_to(move):
+    return (move >> 6) & 63
+
+
+def move_flag(move):
+    return move >> 12
+
+
+def move_to_uci(move):
+    # Long algebraic notation, e.g. e2e4 or e7e8q
+    uci = square_name(move & 63) + square_name((move >> 6) & 63)
+    if move >> 12 & PROMOTION:
+        uci += PROMOTION_CHARS[(move >> 12) & 3]
+    return uci
+
+
+def parse_uci_move(gamestate, uci):
+    for move in gamestate.legal_moves():
+        if move_to_uci(move) == uci:
+            return move
+    raise ValueError(f'Illegal move {uci!r}')
+
+
+# Conversions to and from the (x, y) coordinates of the UI
+
+def square_to_pos(sq):
+    return (sq & 7, sq >> 3)
+
+
+def pos_to_square(pos):
+    return pos[1] * 8 + pos[0]
+
+
+def move_to_positions(move):
+    return square_to_pos(move & 63), square_to_pos((move >> 6) & 63)
+
+
+def _step_attacks(steps):
+    table = []
+    for sq in range(64):
+        x, y = sq & 7, sq >> 3
+        attacks = 0
+        for dx, dy in steps:
+            if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                attacks |= BIT[(y + dy) * 8 + x + dx]
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _step_attacks(
+    [(1, 2), (-1, 2), (-1, -2), (1, -2), (2, 1), (-2, 1), (-2, -1), (2, -1)])
+KING_ATTACKS = _step_attacks(
+    [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)])
+# Squares attacked by a pawn of the given color standing on a square
+PAWN_ATTACKS = (_step_attacks([(-1, -1), (1, -1)]), _step_attacks([(-1, 1), (1, 1)]))
+
+
+def _line_mask(sq, dx, dy):
+    # Every square on the line through sq in both directions, sq excluded
+    x, y = sq & 7, sq >> 3
+    mask = 0
+    for sign in (1, -1):
+        x_, y_ = x + sign * dx, y + sign * dy
+        while 0 <= x_ < 8 and 0 <= y_ < 8:
+            mask |= BIT[y_ * 8 + x_]
+            x_, y_ = x_ + sign * dx, y_ + sign * dy
+    return mask
+
+
+def _between_and_lines():
+    # BIT_BETWEEN[a * 64 + b]: squares strictly between two aligned squares.
+    # LINE[a * 64 + b]: the whole rank, file or diagonal through both.
+    # Both are 0 for squares that do not share a line.
+    between = [0] * 4096
+    lines = [0] * 4096
+    for a in range(64):
+        for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1), (-1, 0), (0, -1), (-1, -1), (-1, 1)):
+            line = _line_mask(a, dx, dy) | BIT[a]
+            x, y = (a & 7) + dx, (a >> 3) + dy
+            squares = 0
+            while 0 <= x < 8 and 0 <= y < 8:
+                b = y * 8 + x
+                between[a * 64 + b] = squares
+                lines[a * 64 + b] = line
+                squares |= BIT[b]
+                x, y = x + dx, y + dy
+    return between, lines
+
+
+FILE_MASKS = [_line_mask(sq, 0, 1) for sq in range(64)]
+DIAGONAL_MASKS = [_line_mask(sq, 1, 1) for sq in range(64)]
+ANTI_DIAGONAL_MASKS = [_line_mask(sq, 1, -1) for sq in range(64)]
+BIT_BETWEEN, LINE = _between_and_lines()
+
+
+def _rank_attacks():
+    # RANK_ATTACKS[x][occupancy of the rank] for a slider on file x
+    table = []
+    for x in range(8):
+        row = []
+        for occ in range(256):
+            attacks = 0
+            for step in (1, -1):
+                x_ = x + step
+                while 0 <= x_ < 8:
+                    attacks |= 1 << x_
+                    if occ & (1 << x_):
+                        break
+                    x_ += step
+            row.append(attacks)
+        table.append(row)
+    return table
+
+
+RANK_ATTACKS = _rank_attacks()
+
+
+def bswap(bb):
+    # Byte swap mirrors the board vertically, which reverses any file or
+    # diagonal since those hold at most one square per rank.
+    return int.from_bytes(bb.to_bytes(8, 'big'), 'little')
+
+
+BIT_X2 = [BIT[sq] << 1 for sq in range(64)]
+SWAPPED_BIT_X2 = [bswap(BIT[sq]) << 1 for sq in range(64)]
+
+
+def _line_attacks(sq, occ, mask):
+    # Hyperbola quintessence: o - 2s sets the bits up to the first blocker
+    # above the slider, the same trick on the mirrored board gives the
+    # squares below it.
+    occ &= mask
+    forward = occ - BIT_X2[sq]
+    reverse = (bswap(occ) - SWAPPED_BIT_X2[sq]) & FULL
+    return (forward ^ bswap(reverse)) & mask
+
+
+def bishop_attacks(sq, occ):
+    return (_line_attacks(sq, occ, DIAGONAL_MASKS[sq])
+            | _line_attacks(sq, occ, ANTI_DIAGONAL_MASKS[sq]))
+
+
+def rook_attacks(sq, occ):
+    shift = sq & 56
+    rank = RANK_ATTACKS[sq & 7][(occ >> shift) & 0xFF] << shift
+    return rank | _line_attacks(sq, occ, FILE_MASKS[sq])
+
+
+def queen_attacks(sq, occ):
+    return bishop_attacks(sq, occ) | rook_attacks(sq, occ)
+
+
+def iter_bits(bb):
+    while bb:
+        bit = bb & -bb
+        yield bit.bit_length() - 1
+        bb ^= bit
+
+
+INITIAL_SETUP = [
+    ['R', 'N', 'B', 'Q', 'K', 'B', 'N', 'R'],
+    ['p'] * 8,
+    [None] * 8,
+    [None] * 8,
+    [None] * 8,
+    [None] * 8,
+    ['p'] * 8,
+    ['R', 'N', 'B', 'Q', 'K', 'B', 'N', 'R'],
+]
+
+
+def _initial_pieces():
+    pieces = [0] * 12
+    for y, row in enumerate(INITIAL_SETUP):
+        color = BLACK if y < 4 else WHITE
+        for x, char in enumerate(row):
+            if char is not None:
+                pieces[color * 6 + PIECE_CHARS.index(char)] |= BIT[y * 8 + x]
+    return pieces
+
+
+INITIAL_PIECES = _initial_pieces()
+
+
+class BitboardGameState():
+    def __init__(self):
+        self.set_position(INITIAL_PIECES, WHITE, WHITE_OO | WHITE_OOO | BLACK_OO | BLACK_OOO)
+
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f'Invalid FEN: {fen!r}')
+        placement, side, castling, ep = fields[:4]
+
+        pieces = [0] * 12
+        rows = placement.split('/')
+        if len(rows) != 8:
+            raise ValueError(f'Invalid FEN: {fen!r}')
+        for y, row in enumerate(rows):
+            x = 0
+            for char in row:
+                if char.isdigit():
+                    x += int(char)
+                    continue
+                kind = 'pnbrqk'.index(char.lower())
+                pieces[(WHITE if char.isupper() else BLACK) * 6 + kind] |= BIT[y * 8 + x]
+                x += 1
+
+        rights = 0
+        for char, right in zip('KQkq', (WHITE_OO, WHITE_OOO, BLACK_OO, BLACK_OOO)):
+            if char in castling:
+                rights |= right
+
+        gamestate = cls.__new__(cls)
+        gamestate.set_position(
+            pieces, WHITE if side == 'w' else BLACK, rights,
+            None if ep == '-' else parse_square(ep),
+            int(fields[4]) if len(fields) > 4 else 0,
+            int(fields[5]) if len(fields) > 5 else 1)
+        return gamestate
+
+    def to_fen(self):
+        rows = []
+        for y in range(8):
+            row = ''
+            empty = 0
+            for x in range(8):
+                piece = self.squares[y * 8 + x]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                char = 'pnbrqk'[piece % 6]
+                row += char.upper() if piece < 6 else char
+            rows.append(row + (str(empty) if empty else ''))
+
+        castling = ''.join(char for char, right in zip('KQkq', (WHITE_OO, WHITE_OOO, BLACK_OO,
+                                                               BLACK_OOO))
+                           if self.castling & right) or '-'
+        ep = square_name(self.ep_square) if self.ep_square is not None else '-'
+        # fullmove_number is the one the position was set up with
+        plies = len(self.undo_stack) + (self.side ^ (len(self.undo_stack) & 1))
+        return (f"{'/'.join(rows)} {'w' if self.side == WHITE else 'b'} {castling} {ep} "
+                f'{self.halfmove_clock} {self.fullmove_number + plies // 2}')
+
+    def set_position(self, pieces, side=WHITE, castling=0, ep_square=None, halfmove_clock=0,
+                     fullmove_number=1):
+        # One bitboard per piece, indexed by color * 6 + kind
+        self.pieces = [0] * 12
+        self.occupancy = [0, 0]
+        # Mailbox of piece indexes, for "what is on this square" lookups
+        self.squares = [None] * 64
+        # Zobrist key and evaluation terms, updated incrementally as pieces
+        # come and go
+        self.hash = 0
+        # Key of the pawns only, for the pawn structure cache
+        self.pawn_hash = 0
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        # First layer sums of a core.nnue network, set by an engine that
+        # evaluates with one. Pieces added here go into a fresh one.
+        self.accumulator = None
+
+        for piece, bb in enumerate(pieces):
+            for sq in iter_bits(bb):
+                self._add_piece(piece, sq)
+
+        self.side = side
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.hash = self.compute_hash()
+        self.undo_stack = []
+        # Attack maps cached per ply as [hash, white map, black map]
+        self.attack_maps = []
+
+    def _add_piece(self, piece, sq):
+        self.pieces[piece] |= BIT[sq]
+        self.occupancy[piece // 6] |= BIT[sq]
+        self.squares[sq] = piece
+        self.hash ^= PIECE_KEYS[piece][sq]
+        self.pawn_hash ^= PAWN_KEYS[piece][sq]
+        self.mg_score += MG_TABLE[piece][sq]
+        self.eg_score += EG_TABLE[piece][sq]
+        self.phase += PHASE[piece]
+        if self.accumulator is not None:
+            self.accumulator.add(piece, sq)
+
+    def _remove_piece(self, piece, sq):
+        self.pieces[piece] ^= BIT[sq]
+        self.occupancy[piece // 6] ^= BIT[sq]
+        self.squares[sq] = None
+        self.hash ^= PIECE_KEYS[piece][sq]
+        self.pawn_hash ^= PAWN_KEYS[piece][sq]
+        self.mg_score -= MG_TABLE[piece][sq]
+        self.eg_score -= EG_TABLE[piece][sq]
+        self.phase -= PHASE[piece]
+        if self.accumulator is not None:
+            self.accumulator.remove(piece, sq)
+
+    # Compatibility with the list based GameState used by Board and Main
+
+    @property
+    def current_turn_color(self):
+        return COLOR_CHARS[self.side]
+
+    def change_to_next_players_turn(self):
+        self.side ^= 1
+        self.hash ^= SIDE_KEY
+
+    @property
+    def position(self):
+        return [[self.get_piece_type((x, y)) for x in range(8)] for y in range(8)]
+
+    # NumPy and pieces.py are only needed by these UI methods, so they are
+    # imported here and engine workers start without them.
+
+    @property
+    def color_mask(self):
+        import numpy as np
+        mask = np.zeros((8, 8), dtype=int)
+        for sq, piece in enumerate(self.squares):
+            if piece is not None:
+                mask[sq >> 3, sq & 7] = 1 if piece < 6 else -1
+        return mask
+
+    def get_piece_type(self, pos):
+        x, y = pos
+        piece = self.squares[y * 8 + x]
+        if piece is None:
+            return None
+        from core.pieces import Pawn, Knight, Bishop, Rook, Queen, King
+        color, kind = divmod(piece, 6)
+        obj = (Pawn, Knight, Bishop, Rook, Queen, King)[kind](COLOR_CHARS[color])
+        if kind == PAWN:
+            obj.has_moved = y != (6 if color == WHITE else 1)
+        return obj
+
+    def legal_targets(self, pos):
+        # {(x, y): move} for the legal moves of the piece on pos. A pawn
+        # reaching the last rank maps to its queen promotion.
+        from_sq = pos[1] * 8 + pos[0]
+        targets = {}
+        for move in self.legal_moves():
+            if move & 63 == from_sq:
+                to_pos = ((move >> 6) & 7, (move >> 9) & 7)
+                if to_pos not in targets or (move >> 12) & 3 == QUEEN - KNIGHT:
+                    targets[to_pos] = move
+        return targets
+
+    def is_in_check(self, color):
+        color = COLOR_CHARS.index(color)
+        return self.is_square_attacked(self.king_square(color), color ^ 1)
+
+    def get_king_location(self, color):
+        import numpy as np
+        king = self.pieces[COLOR_CHARS.index(color) * 6 + KING]
+        sq = king.bit_length() - 1
+        return np.array([sq & 7, sq >> 3])
+
+    def move(self, pos_from, pos_to):
+        # Plays whatever the UI asks for, like GameState.move, and infers the
+        # special move flags from the board.
+        from_sq = pos_from[1] * 8 + pos_from[0]
+        to_sq = pos_to[1] * 8 + pos_to[0]
+        piece = self.squares[from_sq]
+        color, kind = divmod(piece, 6)
+        flag = CAPTURE if self.squares[to_sq] is not None else QUIET
+
+        if kind == KING and abs(to_sq - from_sq) == 2:
+            flag = KING_CASTLE if to_sq > from_sq else QUEEN_CASTLE
+        elif kind == PAWN:
+            if to_sq == self.ep_square and flag == QUIET and (to_sq - from_sq) % 8:
+                flag = EP_CAPTURE
+            elif abs(to_sq - from_sq) == 16:
+                flag = DOUBLE_PUSH
+            elif BIT[to_sq] & (RANKS[0] | RANKS[7]):
+                flag |= PROMOTION + QUEEN - KNIGHT
+
+        if color != self.side:
+            self.change_to_next_players_turn()
+        move = encode_move(from_sq, to_sq, flag)
+        self.make_move(move)
+        return move
+
+    # Move making
+
+    def make_move(self, move):
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flag = move >> 12
+        piece = self.squares[from_sq]
+        captured = None
+        previous_hash = self.hash
+
+        if flag == EP_CAPTURE:
+            cap_sq = to_sq + 8 if self.side == WHITE else to_sq - 8
+            captured = self.squares[cap_sq]
+            self._remove_piece(captured, cap_sq)
+        elif flag & CAPTURE:
+            captured = self.squares[to_sq]
+            self._remove_piece(captured, to_sq)
+
+        self.undo_stack.append(
+            (move, self.castling, self.ep_square, self.halfmove_clock, captured, previous_hash))
+
+        self._remove_piece(piece, from_sq)
+        if flag & PROMOTION:
+            self._add_piece(piece - PAWN + KNIGHT + (flag & 3), to_sq)
+        else:
+            self._add_piece(piece, to_sq)
+
+        if flag == KING_CASTLE:
+            rook = self.squares[from_sq + 3]
+            self._remove_piece(rook, from_sq + 3)
+            self._add_piece(rook, from_sq + 1)
+        elif flag == QUEEN_CASTLE:
+            rook = self.squares[from_sq - 4]
+            self._remove_piece(rook, from_sq - 4)
+            self._add_piece(rook, from_sq - 1)
+
+        castling = self.castling & CASTLE_MASK[from_sq] & CASTLE_MASK[to_sq]
+        self.hash ^= CASTLING_KEYS[self.castling] ^ CASTLING_KEYS[castling] ^ SIDE_KEY
+        self.castling = castling
+        if self.ep_square is not None:
+            self.hash ^= EP_FILE_KEYS[self.ep_square & 7]
+        if flag == DOUBLE_PUSH:
+            self.ep_square = (from_sq + to_sq) >> 1
+            self.hash ^= EP_FILE_KEYS[self.ep_square & 7]
+        else:
+            self.ep_square = None
+        if captured is not None or piece % 6 == PAWN:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.side ^= 1
+
+    def unmake_move(self):
+        move, self.castling, self.ep_square, self.halfmove_clock, captured, previous_hash = \
+            self.undo_stack.pop()
+        self.side ^= 1
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flag = move >> 12
+
+        piece = self.squares[to_sq]
+        self._remove_piece(piece, to_sq)
+        if flag & PROMOTION:
+            piece = self.side * 6 + PAWN
+        self._add_piece(piece, from_sq)
+
+        if flag == EP_CAPTURE:
+            self._add_piece(captured, to_sq + 8 if self.side == WHITE else to_sq - 8)
+        elif captured is not None:
+            self._add_piece(captured, to_sq)
+
+        if flag == KING_CASTLE:
+            rook = self.squares[from_sq + 1]
+            self._remove_piece(rook, from_sq + 1)
+            self._add_piece(rook, from_sq + 3)
+        elif flag == QUEEN_CASTLE:
+            rook = self.squares[from_sq - 1]
+            self._remove_piece(rook, from_sq - 1)
+            self._add_piece(rook, from_sq - 4)
+
+        self.hash = previous_hash
+
+    def make_null_move(self):
+        # Passes the turn, for null move pruning. The halfmove clock
+        # restarts, so repetition checks never look back past a null move.
+        self.undo_stack.append(
+            (NULL_MOVE, self.castling, self.ep_square, self.halfmove_clock, None, self.hash))
+        if self.ep_square is not None:
+            self.hash ^= EP_FILE_KEYS[self.ep_square & 7]
+            self.ep_square = None
+        self.hash ^= SIDE_KEY
+        self.halfmove_clock = 0
+        self.side ^= 1
+
+    def unmake_null_move(self):
+        _, self.castling, self.ep_square, self.halfmove_clock, _, self.hash = \
+            self.undo_stack.pop()
+        self.side ^= 1
+
+    def compute_hash(self):
+        # Full recompute, for loading positions and checking the incremental key
+        key = CASTLING_KEYS[self.castling]
+        for sq, piece in enumerate(self.squares):
+            if piece is not None:
+                key ^= PIECE_KEYS[piece][sq]
+        if self.ep_square is not None:
+            key ^= EP_FILE_KEYS[self.ep_square & 7]
+        if self.side == BLACK:
+            key ^= SIDE_KEY
+        return key
+
+    def compute_pawn_hash(self):
+        key = 0
+        for sq, piece in enumerate(self.squares):
+            if piece is not None:
+                key ^= PAWN_KEYS[piece][sq]
+        return key
+
+    def is_repetition(self):
+        # Compare with earlier positions with the same side to play, back to
+        # the last capture or pawn move. The undo records hold their keys.
+        stack = self.undo_stack
+        for ply in range(4, min(self.halfmove_clock, len(stack)) + 1, 2):
+            if stack[-ply][5] == self.hash:
+                return True
+        return False
+
+    # Attacks and move generation
+
+    def is_square_attacked(self, sq, by_color, occ=None):
+        # Looks outwards from sq: pawn, knight and king tables, then one
+        # slider lookup per line type. occ overrides the board occupancy.
+        pieces = self.pieces
+        base = by_color * 6
+        if PAWN_ATTACKS[by_color ^ 1][sq] & pieces[base + PAWN]:
+            return True
+        if KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & pieces[base + KING]:
+            return True
+        if occ is None:
+            occ = self.occupancy[WHITE] | self.occupancy[BLACK]
+        queens = pieces[base + QUEEN]
+        if bishop_attacks(sq, occ) & (pieces[base + BISHOP] | queens):
+            return True
+        if rook_attacks(sq, occ) & (pieces[base + ROOK] | queens):
+            return True
+        return False
+
+    def attack_map(self, color):
+        # Every square attacked by color. Sliders see through the other
+        # side's king, so the map also shows where that king cannot step.
+        # Computed on demand rather than updated in make_move: one map
+        # costs several make/unmakes, and the search asks for one every
+        # 20-odd moves (castling is the only reader). Maps are cached per
+        # ply and still valid after unmake_move brings the same position
+        # back.
+        ply = len(self.undo_stack)
+        maps = self.attack_maps
+        while len(maps) <= ply:
+            maps.append([None, None, None])
+        entry = maps[ply]
+        if entry[0] != self.hash:
+            entry[0] = self.hash
+            entry[1] = entry[2] = None
+        attacks = entry[1 + color]
+        if attacks is None:
+            attacks = entry[1 + color] = self._compute_attack_map(color)
+        return attacks
+
+    def _compute_attack_map(self, color):
+        pieces = self.pieces
+        base = color * 6
+        occ = (self.occupancy[WHITE] | self.occupancy[BLACK]) ^ pieces[(color ^ 1) * 6 + KING]
+
+        pawns = pieces[base + PAWN]
+        if color == WHITE:
+            attacks = ((pawns >> 9) & NOT_FILE_H) | ((pawns >> 7) & NOT_FILE_A)
+        else:
+            attacks = ((pawns << 9) & NOT_FILE_A & FULL) | ((pawns << 7) & NOT_FILE_H)
+        for sq in iter_bits(pieces[base + KNIGHT]):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in iter_bits(pieces[base + BISHOP] | pieces[base + QUEEN]):
+            attacks |= bishop_attacks(sq, occ)
+        for sq in iter_bits(pieces[base + ROOK] | pieces[base + QUEEN]):
+            attacks |= rook_attacks(sq, occ)
+        return attacks | KING_ATTACKS[self.king_square(color)]
+
+    def king_square(self, color):
+        return self.pieces[color * 6 + KING].bit_length() - 1
+
+    def in_check(self):
+        return self.is_square_attacked(self.king_square(self.side), self.side ^ 1)
+
+    def legal_moves(self, captures_only=False):
+        # Fully legal moves for the side to play, from the pins and checks
+        # of the position rather than make/test/unmake. captures_only keeps
+        # captures and promotions, for quiescence search.
+        moves = []
+        us = self.side
+        them = us ^ 1
+        base = us * 6
+        pieces = self.pieces
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occ = own | enemy
+        empty = FULL ^ occ
+        king_sq = self.king_square(us)
+        enemy_base = them * 6
+        enemy_diagonal = pieces[enemy_base + BISHOP] | pieces[enemy_base + QUEEN]
+        enemy_straight = pieces[enemy_base + ROOK] | pieces[enemy_base + QUEEN]
+
+        checkers = (PAWN_ATTACKS[us][king_sq] & pieces[enemy_base + PAWN]
+                    | KNIGHT_ATTACKS[king_sq] & pieces[enemy_base + KNIGHT]
+                    | bishop_attacks(king_sq, occ) & enemy_diagonal
+                    | rook_attacks(king_sq, occ) & enemy_straight)
+
+        # King moves, tested with the king lifted off the board so sliders
+        # see through the square it is leaving
+        king_occ = occ ^ BIT[king_sq]
+        targets = KING_ATTACKS[king_sq] & (enemy if captures_only else FULL ^ own)
+        for to_sq in iter_bits(targets):
+            if not self.is_square_attacked(to_sq, them, king_occ):
+                moves.append(king_sq | (to_sq << 6) | ((CAPTURE if BIT[to_sq] & enemy else QUIET) << 12))
+
+        if checkers & (checkers - 1):
+            # Double check, only the king can move
+            return moves
+
+        if checkers:
+            # Capture the checker or block the line it checks along
+            target_mask = BIT_BETWEEN[king_sq * 64 + checkers.bit_length() - 1] | checkers
+        else:
+            target_mask = FULL
+            if not captures_only:
+                self._generate_castling(moves, occ)
+
+        # Own pieces alone between the king and an enemy slider are pinned
+        # and may only move along that line
+        pinned = 0
+        snipers = (bishop_attacks(king_sq, enemy) & enemy_diagonal
+                   | rook_attacks(king_sq, enemy) & enemy_straight)
+        for sniper in iter_bits(snipers):
+            blockers = BIT_BETWEEN[king_sq * 64 + sniper] & occ
+            if blockers & own and not blockers & (blockers - 1):
+                pinned |= blockers
+        line_base = king_sq * 64
+
+        # Pawns that are not pinned are generated set-wise. Each target set
+        # comes with the offset back to the pawn that produced it.
+        pawns = pieces[base + PAWN]
+        free_pawns = pawns & ~pinned
+        if us == WHITE:
+            single = (free_pawns >> 8) & empty
+            double = ((single & RANKS[5]) >> 8) & empty
+            targets = ((single, 8, QUIET),
+                       ((free_pawns >> 9) & NOT_FILE_H & enemy, 9, CAPTURE),
+                       ((free_pawns >> 7) & NOT_FILE_A & enemy, 7, CAPTURE))
+            push, double_offset, last_rank, start_rank = -8, 16, RANKS[0], RANKS[6]
+        else:
+            single = (free_pawns << 8) & empty
+            double = ((single & RANKS[2]) << 8) & empty
+            targets = ((single, -8, QUIET),
+                       ((free_pawns << 9) & NOT_FILE_A & enemy, -9, CAPTURE),
+                       ((free_pawns << 7) & NOT_FILE_H & enemy, -7, CAPTURE))
+            push, double_offset, last_rank, start_rank = 8, -16, RANKS[7], RANKS[1]
+
+        if captures_only:
+            targets = ((single & last_rank,) + targets[0][1:],) + targets[1:]
+            double = 0
+
+        for bb, offset, flag in targets:
+            bb &= target_mask
+            for to_sq in iter_bits(bb & last_rank):
+                for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                    moves.append(encode_move(
+                        to_sq + offset, to_sq, flag | PROMOTION | (promotion - KNIGHT)))
+            for to_sq in iter_bits(bb & ~last_rank):
+                moves.append(to_sq + offset | (to_sq << 6) | (flag << 12))
+        for to_sq in iter_bits(double & target_mask):
+            moves.append(encode_move(to_sq + double_offset, to_sq, DOUBLE_PUSH))
+
+        # A pinned piece can never answer a check
+        if not checkers:
+            for from_sq in iter_bits(pawns & pinned):
+                line = LINE[line_base + from_sq]
+                to_sq = from_sq + push
+                bb = PAWN_ATTACKS[us][from_sq] & enemy & line
+                if BIT[to_sq] & empty & line and (not captures_only or BIT[to_sq] & last_rank):
+                    bb |= BIT[to_sq]
+                    if BIT[from_sq] & start_rank and not captures_only \
+                            and BIT[to_sq + push] & empty:
+                        moves.append(encode_move(from_sq, to_sq + push, DOUBLE_PUSH))
+                for to_sq in iter_bits(bb):
+                    flag = CAPTURE if BIT[to_sq] & enemy else QUIET
+                    if BIT[to_sq] & last_rank:
+                        for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                            moves.append(encode_move(
+                                from_sq, to_sq, flag | PROMOTION | (promotion - KNIGHT)))
+                    else:
+                        moves.append(encode_move(from_sq, to_sq, flag))
+
+        if self.ep_square is not None:
+            # Rare enough to test by playing it. This also covers the pawn
+            # that just moved giving check, and both pawns leaving a rank
+            # shared by the king and an enemy rook.
+            for from_sq in iter_bits(PAWN_ATTACKS[them][self.ep_square] & pawns):
+                move = encode_move(from_sq, self.ep_square, EP_CAPTURE)
+                self.make_move(move)
+                if not self.is_square_attacked(king_sq, them):
+                    moves.append(move)
+                self.unmake_move()
+
+        mask = (enemy if captures_only else FULL ^ own) & target_mask
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN):
+            for from_sq in iter_bits(pieces[base + kind]):
+                if kind == KNIGHT:
+                    attacks = KNIGHT_ATTACKS[from_sq]
+                elif kind == BISHOP:
+                    attacks = bishop_attacks(from_sq, occ)
+                elif kind == ROOK:
+                    attacks = rook_attacks(from_sq, occ)
+                else:
+                    attacks = queen_attacks(from_sq, occ)
+                attacks &= mask
+                if BIT[from_sq] & pinned:
+                    attacks &= LINE[line_base + from_sq]
+                for to_sq in iter_bits(attacks & enemy):
+                    moves.append(from_sq | (to_sq << 6) | (CAPTURE << 12))
+                for to_sq in iter_bits(attacks & empty):
+                    moves.append(from_sq | (to_sq << 6))
+
+        return moves
+
+    def _generate_castling(self, moves, occ):
+        # (right, squares that must be empty, squares the king starts on,
+        # crosses or lands on, which must not be attacked, move)
+        if self.side == WHITE:
+            options = (
+                (WHITE_OO, BIT[F1] | BIT[G1], BIT[E1] | BIT[F1] | BIT[G1],
+                 encode_move(E1, G1, KING_CASTLE)),
+                (WHITE_OOO, BIT[D1] | BIT[C1] | BIT[B1], BIT[E1] | BIT[D1] | BIT[C1],
+                 encode_move(E1, C1, QUEEN_CASTLE)))
+        else:
+            options = (
+                (BLACK_OO, BIT[F8] | BIT[G8], BIT[E8] | BIT[F8] | BIT[G8],
+                 encode_move(E8, G8, KING_CASTLE)),
+                (BLACK_OOO, BIT[D8] | BIT[C8] | BIT[B8], BIT[E8] | BIT[D8] | BIT[C8],
+                 encode_move(E8, C8, QUEEN_CASTLE)))
+        for right, between, king_path, move in options:
+            if self.castling & right and not occ & between \
+                    and not self.attack_map(self.side ^ 1) & king_path:
+                moves.append(move)
+
+    def is_checkmate(self):
+        return self.in_check() and not self.legal_moves()
+
+    def is_stalemate(self):
+        return not self.in_check() and not self.legal_moves()
+
+
+def generate_legal_moves(gamestate, captures_only=False):
+    return gamestate.legal_moves(captures_only)
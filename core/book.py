@@ -0,0 +1,220 @@
+import argparse
+import heapq
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+
+from core.bitboard import BitboardGameState, STARTING_FEN, WHITE, move_to_uci, parse_uci_move
+
+# A book file is HEADER followed by records sorted by key then move. Keys
+# are this engine's Zobrist hashes, so books are not Polyglot compatible.
+HEADER = b'NINJABK1'
+RECORD = struct.Struct('<QHH')  # key, move, weight
+KEY = struct.Struct('<Q')
+MAX_WEIGHT = 0xFFFF
+
+# Positions after this many plies are left out of new books
+MAX_PLIES = 20
+# Builder entries held in memory before they are spilled to a sorted run
+RUN_ENTRIES = 1000000
+
+
+class OpeningBook():
+    # Read-only and memory-mapped, so every process that opens the same file
+    # shares one copy in the page cache
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(HEADER)) != HEADER:
+                raise ValueError(f'Not an opening book: {path}')
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.n_records = (len(self.map) - len(HEADER)) // RECORD.size
+
+    def __len__(self):
+        return self.n_records
+
+    def close(self):
+        self.map.close()
+
+    def key_at(self, index):
+        return KEY.unpack_from(self.map, len(HEADER) + index * RECORD.size)[0]
+
+    def lower_bound(self, key):
+        # First record with a key >= key
+        low, high = 0, self.n_records
+        while low < high:
+            middle = (low + high) >> 1
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key):
+        # [(move, weight), ...] stored for the position key
+        entries = []
+        index = self.lower_bound(key)
+        while index < self.n_records:
+            record_key, move, weight = RECORD.unpack_from(
+                self.map, len(HEADER) + index * RECORD.size)
+            if record_key != key:
+                break
+            entries.append((move, weight))
+            index += 1
+        return entries
+
+    def choose(self, gamestate, rng=random):
+        # A weighted random book move that is legal here, or None
+        legal = set(gamestate.legal_moves())
+        entries = [(move, weight) for move, weight in self.entries(gamestate.hash)
+                   if move in legal and weight]
+        if not entries:
+            return None
+        pick = rng.randrange(sum(weight for _, weight in entries))
+        for move, weight in entries:
+            pick -= weight
+            if pick < 0:
+                return move
+
+
+def read_games(path):
+    # Yields (fen, uci moves, result) from a match JSON lines file or from
+    # plain text with one game of UCI moves per line, optionally ending in
+    # a result like 1-0. A line that is not a game yields None.
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                if line.startswith('{'):
+                    record = json.loads(line)
+                    fen, moves, result = (record.get('opening', STARTING_FEN), record['moves'],
+                                          record.get('result'))
+                else:
+                    moves = line.split()
+                    result = moves.pop() if moves[-1] in ('1-0', '0-1', '1/2-1/2', '*') \
+                        else None
+                    fen = STARTING_FEN
+                if not moves or not isinstance(moves, list) \
+                        or not all(isinstance(uci, str) for uci in moves):
+                    raise ValueError('no list of moves')
+            except (ValueError, KeyError, IndexError, AttributeError):
+                yield None
+                continue
+            yield fen, moves, result
+
+
+def game_entries(fen, moves, result, max_plies=MAX_PLIES):
+    # (key, move, weight) for the opening moves of one game. Like Polyglot,
+    # a move counts 2 for a win of the side playing it, 1 for a draw or an
+    # unknown result, and 0 for a loss.
+    gamestate = BitboardGameState.from_fen(fen)
+    for uci in moves[:max_plies]:
+        move = parse_uci_move(gamestate, uci)
+        if result == '1/2-1/2' or result not in ('1-0', '0-1'):
+            weight = 1
+        else:
+            weight = 2 if (result == '1-0') == (gamestate.side == WHITE) else 0
+        yield gamestate.hash, move, weight
+        gamestate.make_move(move)
+
+
+def _write_run(counts, directory):
+    run = tempfile.TemporaryFile(dir=directory)
+    for (key, move), weight in sorted(counts.items()):
+        run.write(RECORD.pack(key, move, min(weight, MAX_WEIGHT)))
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    while True:
+        data = run.read(RECORD.size)
+        if len(data) < RECORD.size:
+            return
+        yield RECORD.unpack(data)
+
+
+def build_book(paths, output, max_plies=MAX_PLIES, run_entries=RUN_ENTRIES):
+    # Streams the games into sorted runs of at most run_entries records and
+    # merges them, so memory use does not grow with the collection. A line
+    # that is not a game, or a game with an illegal move or a bad FEN, is
+    # skipped as a whole.
+    directory = os.path.dirname(os.path.abspath(output))
+    runs = []
+    counts = {}
+    games = skipped = 0
+    try:
+        for path in paths:
+            for game in read_games(path):
+                if game is None:
+                    skipped += 1
+                    continue
+                try:
+                    entries = list(game_entries(*game, max_plies))
+                except ValueError:
+                    skipped += 1
+                    continue
+                games += 1
+                for key, move, weight in entries:
+                    counts[key, move] = counts.get((key, move), 0) + weight
+                if len(counts) >= run_entries:
+                    runs.append(_write_run(counts, directory))
+                    counts = {}
+        runs.append(_write_run(counts, directory))
+
+        records = 0
+        with open(output, 'wb') as f:
+            f.write(HEADER)
+            current, total = None, 0
+            for key, move, weight in heapq.merge(*(_read_run(run) for run in runs)):
+                if (key, move) == current:
+                    total += weight
+                    continue
+                if current is not None:
+                    f.write(RECORD.pack(*current, min(total, MAX_WEIGHT)))
+                    records += 1
+                current, total = (key, move), weight
+            if current is not None:
+                f.write(RECORD.pack(*current, min(total, MAX_WEIGHT)))
+                records += 1
+    finally:
+        for run in runs:
+            run.close()
+    return games, records, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or look up an opening book.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build a book from game files')
+    build.add_argument('output')
+    build.add_argument('games', nargs='+',
+                       help='match JSON lines files or text files of UCI moves')
+    build.add_argument('--max-plies', type=int, default=MAX_PLIES)
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book')
+    probe.add_argument('--fen', default=STARTING_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        games, records, skipped = build_book(args.games, args.output, args.max_plies)
+        print(f'{games} games, {records} records, {os.path.getsize(args.output)} bytes'
+              f'{f", skipped {skipped} that could not be read or replayed" if skipped else ""}')
+        return 0
+
+    book = OpeningBook(args.book)
+    entries = book.entries(BitboardGameState.from_fen(args.fen).hash)
+    for move, weight in sorted(entries, key=lambda entry: -entry[1]):
+        print(f'{move_to_uci(move)}: {weight}')
+    book.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
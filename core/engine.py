@@ -0,0 +1,416 @@
+import random
+import time
+from dataclasses import dataclass, field
+
+from core.bitboard import (PAWN, KNIGHT, QUEEN, CAPTURE, EP_CAPTURE, PROMOTION, NULL_MOVE,
+                           move_to_positions)
+from core.evaluation import evaluate_with_pawns
+from core.pawns import PawnTable
+from core.transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+# Centipawn values, indexed by piece kind
+PIECE_VALUES = (100, 320, 330, 500, 900, 20000)
+
+MATE = 100000
+INFINITY = 1000000
+MAX_PLY = 128
+
+# Selective search techniques, each of which can be left out with the
+# engine's selective argument
+SELECTIVE = ('null_move', 'lmr', 'futility', 'reverse_futility', 'check_extensions')
+# Null move: depth reduction of the null move search, one more from depth 7
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+# Late move reductions: quiet moves after the first LMR_MOVES at depth
+# LMR_MIN_DEPTH and up are searched a ply shallower, two plies after
+# LMR_DEEP_MOVES moves. A reduced move that beats alpha is searched again.
+LMR_MIN_DEPTH = 3
+LMR_MOVES = 3
+LMR_DEEP_MOVES = 8
+# Futility: quiet moves are skipped where the static evaluation plus this
+# margin, indexed by depth, cannot reach alpha
+FUTILITY_MARGINS = (0, 150, 300)
+# Reverse futility: a node returns where the static evaluation minus this
+# margin times the depth still beats beta
+REVERSE_FUTILITY_MARGIN = 120
+REVERSE_FUTILITY_MAX_DEPTH = 3
+
+# Limits are only looked at every so many nodes. Small enough that a stop
+# request is seen within a few milliseconds.
+CHECK_EVERY = 256
+
+
+class SearchAborted(Exception):
+    pass
+
+
+@dataclass
+class SearchInfo:
+    depth: int = 0
+    score: int = 0
+    nodes: int = 0
+    time: float = 0.0
+    pv: list = field(default_factory=list)
+    tb_hits: int = 0
+
+    @property
+    def nps(self):
+        return self.nodes / self.time if self.time > 0 else 0.0
+
+
+def score_to_tt(score, ply):
+    # Mate scores are stored relative to the node, not the root
+    if score >= MATE - MAX_PLY:
+        return score + ply
+    if score <= -MATE + MAX_PLY:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score >= MATE - MAX_PLY:
+        return score - ply
+    if score <= -MATE + MAX_PLY:
+        return score + ply
+    return score
+
+
+class Engine():
+    def __init__(self, time_limit=1.0, node_limit=None, max_depth=MAX_PLY - 1, hash_mb=16,
+                 tt=None, book=None, tablebases=None, selective=SELECTIVE, network=None):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.tt = tt if tt is not None else TranspositionTable(hash_mb)
+        # Pawn structure terms by pawn key, kept from one search to the next
+        self.pawn_table = PawnTable()
+        # Searched depth is iteration + depth_offset. Parallel helpers use it
+        # to stay a ply ahead of each other.
+        self.depth_offset = 0
+        # No new iteration starts after this many seconds, since it would
+        # rarely finish before time_limit. None keeps going to time_limit.
+        self.soft_time_limit = None
+        # Book moves are played without searching. A path is opened here.
+        if isinstance(book, str):
+            from core.book import OpeningBook
+            book = OpeningBook(book)
+        self.book = book
+        # Endgame tables, or a directory of them, probed at the root and
+        # inside the tree
+        if isinstance(tablebases, str):
+            from core.tablebase import Tablebases
+            tablebases = Tablebases(tablebases)
+        # With no table loaded there is nothing to probe, and the search
+        # would still count the pieces at every node
+        if tablebases is not None and not tablebases.tables:
+            tablebases = None
+        self.tablebases = tablebases
+        self.selective = selective
+        # core.nnue network evaluating instead of evaluate_with_pawns(), or a path to
+        # its weights file. Imported here so numpy is only loaded with it.
+        if isinstance(network, str):
+            from core.nnue import load_network
+            network = load_network(network)
+        self.network = network
+        self.rng = random.Random()
+        self.info = SearchInfo()
+
+    def evaluate(self, gamestate):
+        # A method so a subclass can wrap it, see instrumentation.py
+        if self.network is not None:
+            return self.network.evaluate(gamestate.accumulator.values, gamestate.side)
+        return evaluate_with_pawns(gamestate, self.pawn_table)
+
+    def find_move(self, gamestate):
+        # Same interface as the old one-ply Opponent: UI coordinates of the
+        # piece to move and of its destination.
+        move = self.search(gamestate)
+        if move is None:
+            return None
+        return move_to_positions(move)
+
+    def search(self, gamestate, ponder=False):
+        # A ponder search ignores the clock until ponderhit_received() says
+        # the expected move was played, and the clock starts from there
+        self.pondering = ponder
+        self.gamestate = gamestate
+        self.nodes = 0
+        self.tb_hits = 0
+        # search_start times the whole search for info.time and nps.
+        # start_time is the clock the limits run on, restarted at ponderhit.
+        self.search_start = self.start_time = time.perf_counter()
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.history = [[0] * 64 for _ in range(12)]
+        self.pv = [[] for _ in range(MAX_PLY + 1)]
+        self.info = SearchInfo()
+        # One flag per technique, so the search tests plain attributes
+        for technique in SELECTIVE:
+            setattr(self, technique, technique in self.selective)
+        self.pruning = self.null_move or self.futility or self.reverse_futility
+        self.tt.new_search()
+        self.tt.reset_counters()
+        self.pawn_table.reset_counters()
+
+        if self.book is not None:
+            move = self.book.choose(gamestate, self.rng)
+            if move is not None:
+                self.info = SearchInfo(pv=[move])
+                return move
+
+        if self.tablebases is not None:
+            move = self.tablebases.best_move(gamestate)
+            if move is not None:
+                self.info = SearchInfo(score=self.tablebase_score(gamestate, 0), pv=[move],
+                                       tb_hits=1)
+                return move
+
+        root_moves = gamestate.legal_moves()
+        if not root_moves:
+            return None
+
+        root_stack_depth = len(gamestate.undo_stack)
+        best_move = root_moves[0]
+        # The accumulator follows the moves of this search only, so it is
+        # built here and dropped again before returning
+        if self.network is not None:
+            gamestate.accumulator = self.network.accumulator(gamestate)
+        try:
+            for iteration in range(1, self.max_depth + 1):
+                depth = min(iteration + self.depth_offset, self.max_depth)
+                # Depth 1 always completes so there is a move to play
+                self.can_abort = iteration > 1
+                self.previous_pv = self.pv[0]
+                # Check extensions stop at twice the iteration depth, so
+                # perpetual checks cannot run the search past MAX_PLY
+                self.max_extension_ply = min(depth * 2, MAX_PLY // 2)
+                try:
+                    score = self.negamax(depth, -INFINITY, INFINITY, 0)
+                except SearchAborted:
+                    # Unwind whatever the aborted iteration left on the board
+                    while len(gamestate.undo_stack) > root_stack_depth:
+                        if gamestate.undo_stack[-1][0] == NULL_MOVE:
+                            gamestate.unmake_null_move()
+                        else:
+                            gamestate.unmake_move()
+                    break
+
+                best_move = self.pv[0][0]
+                self.info = SearchInfo(depth, score, self.nodes,
+                                       time.perf_counter() - self.search_start, list(self.pv[0]))
+                self.info.tb_hits = self.tb_hits
+                self.report(self.info)
+                if abs(score) >= MATE - MAX_PLY or len(root_moves) == 1 \
+                        or depth >= self.max_depth:
+                    break
+                if self.soft_time_limit is not None and not self.pondering \
+                        and time.perf_counter() - self.start_time >= self.soft_time_limit:
+                    break
+        finally:
+            gamestate.accumulator = None
+
+        self.info.nodes = self.nodes
+        self.info.tb_hits = self.tb_hits
+        self.info.time = time.perf_counter() - self.search_start
+        return best_move
+
+    def stop_requested(self):
+        return False
+
+    def ponderhit_received(self):
+        return False
+
+    def report(self, info):
+        # Called with the SearchInfo of every completed iteration
+        pass
+
+    def check_limits(self):
+        if not self.can_abort:
+            return
+        if self.stop_requested():
+            raise SearchAborted()
+        if self.pondering:
+            if not self.ponderhit_received():
+                return
+            self.pondering = False
+            self.start_time = time.perf_counter()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchAborted()
+        if time.perf_counter() - self.start_time >= self.time_limit:
+            raise SearchAborted()
+
+    def order_moves(self, moves, ply, pv_move=0):
+        squares = self.gamestate.squares
+        killers = self.killers[ply]
+        history = self.history
+        scored = []
+        for move in moves:
+            flag = move >> 12
+            if move == pv_move:
+                score = 30000000
+            elif flag & CAPTURE:
+                # MVV-LVA: most valuable victim first, cheapest attacker first
+                attacker = squares[move & 63] % 6
+                victim = PAWN if flag == EP_CAPTURE else squares[(move >> 6) & 63] % 6
+                score = 20000000 + PIECE_VALUES[victim] * 10 - attacker
+            elif flag & PROMOTION:
+                score = 19000000 + (flag & 3)
+            elif move == killers[0]:
+                score = 18000000
+            elif move == killers[1]:
+                score = 17000000
+            else:
+                score = history[squares[move & 63]][(move >> 6) & 63]
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.pv[ply] = []
+        self.nodes += 1
+        if not self.nodes % CHECK_EVERY:
+            self.check_limits()
+
+        gamestate = self.gamestate
+        if ply and (gamestate.halfmove_clock >= 100 or gamestate.is_repetition()):
+            return 0
+        if ply and self.tablebases is not None and self.tablebases.max_pieces >= \
+                bin(gamestate.occupancy[0] | gamestate.occupancy[1]).count('1'):
+            score = self.tablebase_score(gamestate, ply)
+            if score is not None:
+                self.tb_hits += 1
+                return score
+        in_check = (depth > 0 or self.check_extensions) and gamestate.in_check()
+        if in_check and self.check_extensions and ply < self.max_extension_ply:
+            depth += 1
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+
+        entry = self.tt.probe(gamestate.hash)
+        if entry is not None:
+            entry_depth, bound, score, pv_move = entry
+            # No cutoffs at PV nodes (open window): returning here would
+            # cut the principal variation short at this ply
+            if ply and entry_depth >= depth and beta - alpha == 1:
+                score = score_from_tt(score, ply)
+                if bound == EXACT \
+                        or (bound == LOWER and score >= beta) \
+                        or (bound == UPPER and score <= alpha):
+                    return score
+        else:
+            pv_move = self.previous_pv[ply] if ply < len(self.previous_pv) else 0
+
+        # Pruning needs the static evaluation and is off at the root and in
+        # check. Nothing is pruned against a mate score.
+        prunable = ply and not in_check and self.pruning
+        static_eval = self.evaluate(gamestate) if prunable else None
+        if prunable and beta < MATE - MAX_PLY:
+            if self.reverse_futility and depth <= REVERSE_FUTILITY_MAX_DEPTH \
+                    and static_eval - REVERSE_FUTILITY_MARGIN * depth >= beta:
+                return static_eval
+            if self.null_move and depth >= NULL_MOVE_MIN_DEPTH and static_eval >= beta \
+                    and gamestate.undo_stack[-1][0] != NULL_MOVE \
+                    and self.has_pieces(gamestate, gamestate.side):
+                # In pawn endgames zugzwang often makes passing the best
+                # move, so a null move proves nothing there
+                reduction = NULL_MOVE_REDUCTION + (depth >= 7)
+                gamestate.make_null_move()
+                score = -self.negamax(depth - 1 - reduction, -beta, -beta + 1, ply + 1)
+                gamestate.unmake_null_move()
+                if score >= beta:
+                    return beta if score >= MATE - MAX_PLY else score
+
+        moves = gamestate.legal_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        futile = prunable and self.futility and depth < len(FUTILITY_MARGINS) \
+            and alpha > -MATE + MAX_PLY and static_eval + FUTILITY_MARGINS[depth] <= alpha
+        reduce = self.lmr and depth >= LMR_MIN_DEPTH and not in_check
+        killers = self.killers[ply]
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = 0
+        for index, move in enumerate(self.order_moves(moves, ply, pv_move)):
+            quiet = not move >> 12 & (CAPTURE | PROMOTION) and move not in killers
+            gamestate.make_move(move)
+            if quiet and index and (futile or reduce and index >= LMR_MOVES) \
+                    and not gamestate.in_check():
+                if futile:
+                    gamestate.unmake_move()
+                    continue
+                reduction = 2 if index >= LMR_DEEP_MOVES and depth >= 5 else 1
+                score = -self.negamax(depth - 1 - reduction, -alpha - 1, -alpha, ply + 1)
+                if score > alpha:
+                    score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            gamestate.unmake_move()
+
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if score >= beta:
+                        if not move >> 12 & (CAPTURE | PROMOTION):
+                            self.store_killer(move, ply)
+                            self.history[gamestate.squares[move & 63]][(move >> 6) & 63] += \
+                                depth * depth
+                        break
+
+        if best >= beta:
+            bound = LOWER
+        elif best > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+            best_move = 0
+        self.tt.store(gamestate.hash, depth, bound, score_to_tt(best, ply), best_move)
+        return best
+
+    @staticmethod
+    def has_pieces(gamestate, color):
+        # Anything but pawns and the king
+        pieces = gamestate.pieces
+        base = color * 6
+        return any(pieces[base + kind] for kind in range(KNIGHT, QUEEN + 1))
+
+    def tablebase_score(self, gamestate, ply):
+        probed = self.tablebases.probe(gamestate)
+        if probed is None:
+            return None
+        result, plies = probed
+        if result > 0:
+            return MATE - ply - plies
+        if result < 0:
+            return -MATE + ply + plies
+        return 0
+
+    def store_killer(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    def quiescence(self, alpha, beta, ply):
+        gamestate = self.gamestate
+        stand_pat = self.evaluate(gamestate)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        for move in self.order_moves(gamestate.legal_moves(captures_only=True), ply):
+            gamestate.make_move(move)
+            self.nodes += 1
+            if not self.nodes % CHECK_EVERY:
+                self.check_limits()
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            gamestate.unmake_move()
+
+            if score > alpha:
+                alpha = score
+                if score >= beta:
+                    break
+        return alpha
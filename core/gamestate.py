@@ -0,0 +1,227 @@
+import numpy as np
+
+from core.pieces import *
+from core.utils import (
+    opposite_color, KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS)
+from core.zobrist import SIDE_KEY, piece_key
+
+FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+
+
+class GameState():
+    def __init__(self):
+        # self.position = [
+        #     [Rook('b'), Knight('b'), Bishop('b'), Queen('b'), King('b'), Bishop('b'), Knight('b'), Rook('b')],
+        #     [Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b')],
+        #     [None, None, None, None, None, None, None, None],
+        #     [None, None, None, None, None, None, None, None],
+        #     [None, None, None, None, None, Queen('b'), None, None],
+        #     [None, None, None, None, None, None, None, None],
+        #     [Pawn('w'), Pawn('w'), Pawn('w'), None, Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w')],
+        #     [Rook('w'), Knight('w'), Bishop('w'), Queen('w'), King('w'), Bishop('w'), Knight('w'), Rook('w')],
+        # ]
+        self.set_position([
+            [Rook('b'), Knight('b'), Bishop('b'), Queen('b'), King('b'), Bishop('b'), Knight('b'), Rook('b')],
+            [Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b'), Pawn('b')],
+            [None, None, None, None, None, None, None, None],
+            [None, None, None, None, None, None, None, None],
+            [None, None, None, None, None, None, None, None],
+            [None, None, None, None, None, None, None, None],
+            [Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w'), Pawn('w')],
+            [Rook('w'), Knight('w'), Bishop('w'), Queen('w'), King('w'), Bishop('w'), Knight('w'), Rook('w')],
+        ])
+
+    @classmethod
+    def from_fen(cls, fen):
+        # Only piece placement and side to move are used. This backend has
+        # no castling, en passant or move clocks.
+        fields = fen.split()
+        rows = fields[0].split('/') if fields else []
+        if len(rows) != 8:
+            raise ValueError(f'Invalid FEN: {fen!r}')
+        position = []
+        for y, row in enumerate(rows):
+            position_row = []
+            for char in row:
+                if char.isdigit():
+                    position_row.extend([None] * int(char))
+                    continue
+                piece = FEN_PIECES[char.lower()]('w' if char.isupper() else 'b')
+                if isinstance(piece, Pawn):
+                    piece.has_moved = y != (6 if piece.color == 'w' else 1)
+                position_row.append(piece)
+            if len(position_row) != 8:
+                raise ValueError(f'Invalid FEN: {fen!r}')
+            position.append(position_row)
+
+        gamestate = cls.__new__(cls)
+        gamestate.set_position(position, 'b' if len(fields) > 1 and fields[1] == 'b' else 'w')
+        return gamestate
+
+    def set_position(self, position, current_turn_color='w'):
+        self.position = position
+
+        self.color_mask = []
+        for row in self.position:
+            row_ = []
+            for piece in row:
+                if not piece:
+                    row_.append(0)
+                elif piece.color == 'w':
+                    row_.append(1)
+                elif piece.color == 'b':
+                    row_.append(-1)
+            self.color_mask.append(row_)
+
+        self.color_mask = np.array(self.color_mask)
+
+        self.current_turn_color = current_turn_color
+
+        # Zobrist key of the position, kept up to date by update_position
+        self.hash = SIDE_KEY if current_turn_color == 'b' else 0
+        for y, row in enumerate(self.position):
+            for x, piece in enumerate(row):
+                if piece is not None:
+                    self.hash ^= piece_key(piece, x, y)
+                    if isinstance(piece, King):
+                        if piece.color == 'w':
+                            self.w_king_location = np.array([x, y])
+                        else:
+                            self.b_king_location = np.array([x, y])
+
+        self.undo_stack = []
+        # One reusable move buffer per ply, see generate_moves
+        self.move_buffers = []
+
+    def to_fen(self):
+        rows = []
+        for row in self.position:
+            fen_row = ''
+            empty = 0
+            for piece in row:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                char = piece.char.lower()
+                fen_row += char.upper() if piece.color == 'w' else char
+            rows.append(fen_row + (str(empty) if empty else ''))
+        return f"{'/'.join(rows)} {self.current_turn_color} - - 0 1"
+
+    def get_king_location(self, color):
+        if color == 'w':
+            return self.w_king_location
+        elif color == 'b':
+            return self.b_king_location
+
+    def is_square_attacked(self, pos, by_color):
+        # Looks outwards from pos for each kind of attacker instead of
+        # generating the opponent's moves
+        x, y = pos
+        position = self.position
+
+        for targets, kind in ((KNIGHT_TARGETS, Knight), (KING_TARGETS, King)):
+            for x_, y_ in targets[y][x]:
+                piece = position[y_][x_]
+                if isinstance(piece, kind) and piece.color == by_color:
+                    return True
+
+        # A pawn attacks diagonally forwards, so look one row behind pos
+        y_ = y + 1 if by_color == 'w' else y - 1
+        if 0 <= y_ < 8:
+            for x_ in (x - 1, x + 1):
+                if 0 <= x_ < 8:
+                    piece = position[y_][x_]
+                    if isinstance(piece, Pawn) and piece.color == by_color:
+                        return True
+
+        for rays, kind in ((ROOK_RAYS, Rook), (BISHOP_RAYS, Bishop)):
+            for ray in rays[y][x]:
+                for x_, y_ in ray:
+                    piece = position[y_][x_]
+                    if piece is not None:
+                        if piece.color == by_color and isinstance(piece, (kind, Queen)):
+                            return True
+                        break
+        return False
+
+    def is_in_check(self, color):
+        return self.is_square_attacked(self.get_king_location(color), opposite_color(color))
+
+    def change_to_next_players_turn(self):
+        self.current_turn_color = opposite_color(self.current_turn_color)
+        self.hash ^= SIDE_KEY
+
+    def get_piece_type(self, pos):
+        x, y = pos
+        return self.position[y][x]
+
+    def update_position(self, piece, pos_from, pos_to):
+        self.hash ^= piece_key(piece, *pos_from) ^ piece_key(piece, *pos_to)
+
+        # Update position
+        self.position[pos_from[1]][pos_from[0]] = None
+        self.position[pos_to[1]][pos_to[0]] = piece
+
+        # Update color_mask
+        piece = self.color_mask[pos_from[1]][pos_from[0]]
+        self.color_mask[pos_from[1]][pos_from[0]] = 0
+        self.color_mask[pos_to[1]][pos_to[0]] = piece
+
+    def make_move(self, pos_from, pos_to):
+        piece = self.position[pos_from[1]][pos_from[0]]
+        captured = self.position[pos_to[1]][pos_to[0]]
+
+        # Everything the move overwrites, so unmake_move can put it back
+        self.undo_stack.append((
+            pos_from, pos_to, captured, getattr(piece, 'has_moved', None),
+            self.w_king_location, self.b_king_location, self.hash))
+
+        if captured is not None:
+            self.hash ^= piece_key(captured, *pos_to)
+
+        if isinstance(piece, Pawn):
+            piece.has_moved = True
+
+        if isinstance(piece, King):
+            if piece.color == 'w':
+                self.w_king_location = np.array([pos_to[0], pos_to[1]])
+            elif piece.color == 'b':
+                self.b_king_location = np.array([pos_to[0], pos_to[1]])
+
+        self.update_position(piece, pos_from, pos_to)
+
+    def unmake_move(self):
+        (pos_from, pos_to, captured, has_moved,
+         self.w_king_location, self.b_king_location, previous_hash) = self.undo_stack.pop()
+
+        piece = self.position[pos_to[1]][pos_to[0]]
+        self.update_position(piece, pos_to, pos_from)
+        self.hash = previous_hash
+        if has_moved is not None:
+            piece.has_moved = has_moved
+
+        if captured is not None:
+            self.position[pos_to[1]][pos_to[0]] = captured
+            self.color_mask[pos_to[1]][pos_to[0]] = captured.color_representation
+
+    def generate_moves(self):
+        # Pseudo-legal moves of the side to play, in the buffer of the current
+        # ply. Moves made from here use the next ply's buffer, so a caller can
+        # keep iterating this one while it searches below.
+        ply = len(self.undo_stack)
+        while len(self.move_buffers) <= ply:
+            self.move_buffers.append(MoveBuffer())
+        buffer = self.move_buffers[ply]
+        buffer.count = 0
+        color = self.current_turn_color
+        for y, row in enumerate(self.position):
+            for x, piece in enumerate(row):
+                if piece is not None and piece.color == color:
+                    buffer.count = piece._generate_moves(x, y, self, buffer.moves, buffer.count)
+        return buffer
+
+    def move(self, pos_from, pos_to):
+        self.make_move(pos_from, pos_to)
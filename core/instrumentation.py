@@ -0,0 +1,308 @@
+import argparse
+import cProfile
+import io
+import json
+import logging
+import math
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from time import perf_counter_ns
+
+from core.bitboard import BitboardGameState, STARTING_FEN, move_to_uci
+from core.engine import Engine, MAX_PLY
+
+log = logging.getLogger(__name__)
+
+PHASES = ('movegen', 'evaluation', 'check', 'tt_probe', 'tt_store')
+# Check detection mostly runs inside move generation, so its time is part
+# of movegen as well
+NESTED_PHASES = ('check',)
+
+
+class SearchStats():
+    # Counters and per-phase timers of one search. Phase times are in ns.
+    def __init__(self):
+        self.phase_ns = dict.fromkeys(PHASES, 0)
+        self.phase_calls = dict.fromkeys(PHASES, 0)
+        self.moves_generated = 0
+        self.negamax_nodes = 0  # interior nodes, depth 0 is counted by quiescence
+        self.quiescence_nodes = 0
+        self.beta_cutoffs = 0
+        self.quiescence_cutoffs = 0
+        self.iterations = []  # (depth, nodes, time) of each completed iteration
+        self.result = {}
+
+    def add(self, phase, ns):
+        self.phase_ns[phase] += ns
+        self.phase_calls[phase] += 1
+
+    def branching_factors(self):
+        # Nodes of each iteration over those of the one before
+        nodes = [b - a for (_, a, _), (_, b, _) in
+                 zip([(0, 0, 0)] + self.iterations, self.iterations)]
+        return [round(b / a, 2) for a, b in zip(nodes, nodes[1:]) if a]
+
+    def finish(self, engine, table, elapsed_ns):
+        info = engine.info
+        factors = self.branching_factors()
+        self.result = {
+            'move': move_to_uci(info.pv[0]) if info.pv else None,
+            'depth': info.depth,
+            'score': info.score,
+            'nodes': info.nodes,
+            'time_ms': round(elapsed_ns / 1e6, 2),
+            'nps': round(info.nodes / (elapsed_ns / 1e9)) if elapsed_ns else 0,
+            'negamax_nodes': self.negamax_nodes,
+            'quiescence_nodes': self.quiescence_nodes,
+            'phases': {
+                phase: {
+                    'calls': self.phase_calls[phase],
+                    'ms': round(self.phase_ns[phase] / 1e6, 2),
+                    'share': round(self.phase_ns[phase] / elapsed_ns, 4) if elapsed_ns else 0,
+                } for phase in PHASES},
+            'other_share': round(1 - sum(self.phase_ns[phase] for phase in PHASES
+                                         if phase not in NESTED_PHASES) / elapsed_ns, 4)
+            if elapsed_ns else 0,
+            'moves_per_generation': round(
+                self.moves_generated / self.phase_calls['movegen'], 2)
+            if self.phase_calls['movegen'] else 0,
+            'tt': {'probes': table.probes, 'hits': table.hits,
+                   'hit_rate': round(table.hit_rate, 4),
+                   'stores': self.phase_calls['tt_store']},
+            'pawn_table': {'probes': engine.pawn_table.probes, 'hits': engine.pawn_table.hits,
+                           'hit_rate': round(engine.pawn_table.hit_rate, 4)},
+            'cutoffs': {'beta': self.beta_cutoffs, 'quiescence': self.quiescence_cutoffs,
+                        'beta_rate': round(self.beta_cutoffs / self.negamax_nodes, 4)
+                        if self.negamax_nodes else 0},
+            'iterations': [{'depth': depth, 'nodes': nodes, 'time_ms': round(seconds * 1000, 2)}
+                           for depth, nodes, seconds in self.iterations],
+            'branching_factors': factors,
+            'effective_branching_factor': round(
+                math.prod(factors) ** (1 / len(factors)), 2) if factors else None,
+        }
+        return self.result
+
+
+class InstrumentedEngine(Engine):
+    # Engine that counts and times what its search does. Engine itself has
+    # none of this code, so instrumentation costs nothing unless this class
+    # is used. Timing adds overhead of its own, so compare phase shares
+    # rather than absolute speeds against a plain Engine.
+    def __init__(self, *args, stats_path=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Every search appends its stats to this JSON lines file
+        self.stats_path = stats_path
+        self.stats = SearchStats()
+
+    def search(self, gamestate, ponder=False):
+        self.stats = stats = SearchStats()
+        table = self.tt
+        wrapped = self._wrap(gamestate, table, stats)
+        start = perf_counter_ns()
+        try:
+            return super().search(gamestate, ponder)
+        finally:
+            elapsed = perf_counter_ns() - start
+            # The wrappers are instance attributes, deleting them brings the
+            # class methods back
+            for obj, name in wrapped:
+                delattr(obj, name)
+            result = stats.finish(self, table, elapsed)
+            log.debug('search stats: %s', result)
+            if self.stats_path:
+                with open(self.stats_path, 'a') as f:
+                    f.write(json.dumps(result) + '\n')
+
+    def _wrap(self, gamestate, table, stats):
+        # Times calls by shadowing the methods on these two objects only, so
+        # other game states and tables are unaffected
+        legal_moves = gamestate.legal_moves
+        is_square_attacked, attack_map = gamestate.is_square_attacked, gamestate.attack_map
+        probe, store = table.probe, table.store
+
+        def timed_legal_moves(captures_only=False):
+            start = perf_counter_ns()
+            moves = legal_moves(captures_only)
+            stats.add('movegen', perf_counter_ns() - start)
+            stats.moves_generated += len(moves)
+            return moves
+
+        def timed_is_square_attacked(sq, by_color, occ=None):
+            start = perf_counter_ns()
+            result = is_square_attacked(sq, by_color, occ)
+            stats.add('check', perf_counter_ns() - start)
+            return result
+
+        def timed_attack_map(color):
+            start = perf_counter_ns()
+            result = attack_map(color)
+            stats.add('check', perf_counter_ns() - start)
+            return result
+
+        def timed_probe(key):
+            start = perf_counter_ns()
+            entry = probe(key)
+            stats.add('tt_probe', perf_counter_ns() - start)
+            return entry
+
+        def timed_store(key, depth, bound, score, move):
+            start = perf_counter_ns()
+            store(key, depth, bound, score, move)
+            stats.add('tt_store', perf_counter_ns() - start)
+
+        gamestate.legal_moves = timed_legal_moves
+        gamestate.is_square_attacked = timed_is_square_attacked
+        gamestate.attack_map = timed_attack_map
+        table.probe, table.store = timed_probe, timed_store
+        return ((gamestate, 'legal_moves'), (gamestate, 'is_square_attacked'),
+                (gamestate, 'attack_map'), (table, 'probe'), (table, 'store'))
+
+    def evaluate(self, gamestate):
+        start = perf_counter_ns()
+        score = super().evaluate(gamestate)
+        self.stats.add('evaluation', perf_counter_ns() - start)
+        return score
+
+    def negamax(self, depth, alpha, beta, ply):
+        if depth <= 0:
+            return super().negamax(depth, alpha, beta, ply)
+        self.stats.negamax_nodes += 1
+        score = super().negamax(depth, alpha, beta, ply)
+        if score >= beta:
+            self.stats.beta_cutoffs += 1
+        return score
+
+    def quiescence(self, alpha, beta, ply):
+        self.stats.quiescence_nodes += 1
+        score = super().quiescence(alpha, beta, ply)
+        if score >= beta:
+            self.stats.quiescence_cutoffs += 1
+        return score
+
+    def report(self, info):
+        self.stats.iterations.append((info.depth, info.nodes, info.time))
+        super().report(info)
+
+
+def profile_find_move(engine, gamestate, sort='cumulative', limit=25, output=None):
+    # Runs engine.find_move under cProfile. Returns its result and the
+    # report, and saves the raw profile to output for snakeviz and the like.
+    profiler = cProfile.Profile()
+    result = profiler.runcall(engine.find_move, gamestate)
+    if output:
+        profiler.dump_stats(output)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats(sort).print_stats(limit)
+    return result, report.getvalue()
+
+
+class Sampler():
+    # Statistical profiler: a thread looks at the stack of the thread that
+    # created it every interval seconds. Far cheaper than cProfile, so the
+    # search runs close to its normal speed.
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.own = Counter()  # innermost function of each sample
+        self.total = Counter()  # every function on the stack of each sample
+        self.samples = 0
+        self.running = False
+
+    def __enter__(self):
+        self.running = True
+        # The sampler only runs when it gets the GIL, so sample intervals
+        # under the switch interval need a shorter one
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self.interval))
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.running = False
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+
+    def _run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples += 1
+                self.own[self._name(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    name = self._name(frame)
+                    if name not in seen:
+                        seen.add(name)
+                        self.total[name] += 1
+                    frame = frame.f_back
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _name(frame):
+        code = frame.f_code
+        return f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})'
+
+    def report(self, limit=25):
+        lines = [f'{self.samples} samples', f'{"own":>6} {"total":>6}  function']
+        for name, own in self.own.most_common(limit):
+            lines.append(f'{own / self.samples:6.1%} {self.total[name] / self.samples:6.1%}  '
+                         f'{name}')
+        return '\n'.join(lines)
+
+
+def print_stats(result):
+    print(f"{result['move']}: depth {result['depth']} score {result['score']} "
+          f"nodes {result['nodes']} in {result['time_ms']:.0f}ms ({result['nps']} nps)")
+    for phase, phase_stats in result['phases'].items():
+        nested = '  (within movegen)' if phase in NESTED_PHASES else ''
+        print(f"  {phase:11} {phase_stats['calls']:>9} calls {phase_stats['ms']:9.1f}ms "
+              f"{phase_stats['share']:6.1%}{nested}")
+    print(f"  {'other':11} {'':>15} {'':>11} {result['other_share']:6.1%}")
+    tt, cutoffs = result['tt'], result['cutoffs']
+    print(f"  moves per generation {result['moves_per_generation']}, "
+          f"tt hit rate {tt['hit_rate']:.1%} of {tt['probes']} probes, "
+          f"beta cutoffs {cutoffs['beta']} ({cutoffs['beta_rate']:.1%} of interior nodes)")
+    print(f"  pawn table hit rate {result['pawn_table']['hit_rate']:.1%} "
+          f"of {result['pawn_table']['probes']} probes")
+    print(f"  branching factors {result['branching_factors']}, "
+          f"effective {result['effective_branching_factor']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search one position with instrumentation.')
+    parser.add_argument('--fen', default=STARTING_FEN)
+    parser.add_argument('--depth', type=int, default=MAX_PLY - 1)
+    parser.add_argument('--time', type=float, default=float('inf'), help='seconds')
+    parser.add_argument('--nodes', type=int)
+    parser.add_argument('--json', help='JSON lines file the search stats are appended to')
+    parser.add_argument('--profile', choices=('cprofile', 'sample'),
+                        help='also profile the search, which makes it slower')
+    parser.add_argument('--profile-output', help='raw cProfile output file')
+    parser.add_argument('--limit', type=int, default=25, help='functions in the profile')
+    args = parser.parse_args(argv)
+    if args.time == float('inf') and args.nodes is None and args.depth == MAX_PLY - 1:
+        args.depth = 5
+
+    engine = InstrumentedEngine(time_limit=args.time, node_limit=args.nodes,
+                                max_depth=args.depth, stats_path=args.json)
+    gamestate = BitboardGameState.from_fen(args.fen)
+    if args.profile == 'cprofile':
+        _, report = profile_find_move(engine, gamestate, limit=args.limit,
+                                      output=args.profile_output)
+        print(report)
+    elif args.profile == 'sample':
+        with Sampler() as sampler:
+            engine.find_move(gamestate)
+        print(sampler.report(args.limit))
+    else:
+        engine.find_move(gamestate)
+    print_stats(engine.stats.result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
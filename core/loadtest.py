@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from core.bitboard import BitboardGameState, move_to_uci, parse_uci_move
+
+# Wait before sending a refused go again, in seconds, doubled after each
+# refusal up to BUSY_RETRY_MAX
+BUSY_RETRY = 0.02
+BUSY_RETRY_MAX = 0.5
+
+
+class LoadStats():
+    def __init__(self):
+        self.latencies = []  # seconds from the first go to bestmove, retries included
+        self.busy = 0
+        self.games = 0
+        self.errors = 0
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        result = {
+            'games': self.games,
+            'engine_moves': len(latencies),
+            'busy': self.busy,
+            'errors': self.errors,
+            'seconds': round(elapsed, 2),
+            'moves_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        }
+        if len(latencies) >= 2:
+            percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+            result.update(p50_ms=round(percentiles[49] * 1000, 1),
+                          p99_ms=round(percentiles[98] * 1000, 1),
+                          max_ms=round(latencies[-1] * 1000, 1))
+        return result
+
+
+async def connect(host, port, path):
+    if path:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def play_game(address, plies, rng, stats):
+    # One game on its own connection: a random move for the client, then
+    # the engine's reply, until the game ends or is plies half moves long
+    reader, writer = await connect(*address)
+
+    async def request(line):
+        writer.write(line.encode() + b'\n')
+        await writer.drain()
+        return (await reader.readline()).decode().split()
+
+    try:
+        reply = await request('new')
+        if reply[:1] != ['ok']:
+            stats.errors += 1
+            return
+        session_id = reply[1]
+        gamestate = BitboardGameState()
+        while len(gamestate.undo_stack) < plies:
+            moves = gamestate.legal_moves()
+            if not moves:
+                break
+            move = rng.choice(moves)
+            gamestate.make_move(move)
+            if (await request(f'move {session_id} {move_to_uci(move)}'))[:1] != ['ok']:
+                stats.errors += 1
+                return
+            start = time.perf_counter()
+            delay = BUSY_RETRY
+            while True:
+                reply = await request(f'go {session_id}')
+                if reply[:1] != ['busy']:
+                    break
+                stats.busy += 1
+                # Jittered, so refused clients do not all come back at once
+                await asyncio.sleep(delay * rng.uniform(0.5, 1.5))
+                delay = min(delay * 2, BUSY_RETRY_MAX)
+            if reply[:1] != ['bestmove']:
+                stats.errors += 1
+                return
+            stats.latencies.append(time.perf_counter() - start)
+            if reply[2] == '0000':
+                break
+            gamestate.make_move(parse_uci_move(gamestate, reply[2]))
+        await request(f'close {session_id}')
+        stats.games += 1
+    finally:
+        writer.close()
+
+
+async def run(address, games, plies, seed=0):
+    stats = LoadStats()
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    await asyncio.gather(*(play_game(address, plies, random.Random(rng.random()), stats)
+                           for _ in range(games)))
+    return stats.summary(time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Play many games against core.server at once and time its engine moves.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='connect to this Unix socket instead')
+    parser.add_argument('--games', type=int, default=100, help='concurrent games')
+    parser.add_argument('--plies', type=int, default=40, help='half moves per game')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run((args.host, args.port, args.unix), args.games, args.plies,
+                             args.seed))
+    print(f"{result['games']} games, {result['engine_moves']} engine moves in "
+          f"{result['seconds']}s ({result['moves_per_second']} moves/s), "
+          f"{result['busy']} busy replies, {result['errors']} errors")
+    if 'p50_ms' in result:
+        print(f"engine move latency: p50 {result['p50_ms']}ms, p99 {result['p99_ms']}ms, "
+              f"max {result['max_ms']}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
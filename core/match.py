@@ -0,0 +1,223 @@
+import argparse
+import ast
+import json
+import math
+import multiprocessing
+import sys
+import time
+
+from core.bitboard import (BitboardGameState, STARTING_FEN, WHITE, BLACK, KNIGHT, BISHOP,
+                           move_to_uci)
+from core.engine import Engine
+
+# Balanced positions a few moves into common openings. Each one is played
+# twice, once with either engine as white.
+OPENINGS = [
+    STARTING_FEN,
+    'rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+    'rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2',
+    'r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3',
+    'rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2',
+    'rnbqkb1r/pppppp1p/5np1/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3',
+    'rnbqkbnr/pp2pppp/2p5/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq - 0 3',
+    'rnbqkbnr/pppp1ppp/4p3/8/3PP3/8/PPP2PPP/RNBQKBNR b KQkq - 0 2',
+    'rnbqkb1r/pppp1ppp/4pn2/8/2PP4/2N5/PP2PPPP/R1BQKBNR b KQkq - 1 3',
+    'rnbqkbnr/pppppppp/8/8/2P5/8/PP1PPPPP/RNBQKBNR b KQkq - 0 1',
+]
+
+MAX_PLIES = 400
+
+
+def parse_config(options):
+    # ['time_limit=0.1', 'node_limit=5000'] -> Engine keyword arguments
+    config = {}
+    for option in options or ():
+        name, _, value = option.partition('=')
+        try:
+            config[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            config[name] = value
+    return config
+
+
+def repetitions(gamestate):
+    # How many times the current position has occurred
+    stack = gamestate.undo_stack
+    count = 1
+    for ply in range(2, min(gamestate.halfmove_clock, len(stack)) + 1, 2):
+        if stack[-ply][5] == gamestate.hash:
+            count += 1
+    return count
+
+
+def insufficient_material(gamestate):
+    pieces = gamestate.pieces
+    minors = 0
+    for color in (WHITE, BLACK):
+        for kind in range(5):
+            count = bin(pieces[color * 6 + kind]).count('1')
+            if kind in (KNIGHT, BISHOP):
+                minors += count
+            elif count:
+                return False
+    return minors <= 1
+
+
+def adjudicate(gamestate):
+    # (result, reason) once the game is over, else None
+    if not gamestate.legal_moves():
+        if gamestate.in_check():
+            return ('0-1' if gamestate.side == WHITE else '1-0'), 'checkmate'
+        return '1/2-1/2', 'stalemate'
+    if gamestate.halfmove_clock >= 100:
+        return '1/2-1/2', 'fifty moves'
+    if repetitions(gamestate) >= 3:
+        return '1/2-1/2', 'repetition'
+    if insufficient_material(gamestate):
+        return '1/2-1/2', 'insufficient material'
+    if len(gamestate.undo_stack) >= MAX_PLIES:
+        return '1/2-1/2', 'move limit'
+    return None
+
+
+def play_game(task):
+    # One game from an opening. engine1_white says which config is white.
+    game, fen, engine1_white, configs = task
+    engines = [Engine(**configs[0]), Engine(**configs[1])]
+    if not engine1_white:
+        engines.reverse()
+
+    gamestate = BitboardGameState.from_fen(fen)
+    moves = []
+    nodes = [0, 0]
+    search_time = [0.0, 0.0]
+    while True:
+        outcome = adjudicate(gamestate)
+        if outcome is not None:
+            break
+        engine = engines[gamestate.side]
+        move = engine.search(gamestate)
+        nodes[gamestate.side] += engine.info.nodes
+        search_time[gamestate.side] += engine.info.time
+        moves.append(move_to_uci(move))
+        gamestate.make_move(move)
+
+    result, reason = outcome
+    # Stats keyed by config, not by color
+    order = (0, 1) if engine1_white else (1, 0)
+    return {
+        'game': game,
+        'opening': fen,
+        'white': 'engine1' if engine1_white else 'engine2',
+        'result': result,
+        'reason': reason,
+        'moves': moves,
+        'nodes': [nodes[order[0]], nodes[order[1]]],
+        'time': [search_time[order[0]], search_time[order[1]]],
+    }
+
+
+def engine1_score(record):
+    if record['result'] == '1/2-1/2':
+        return 0.5
+    white_won = record['result'] == '1-0'
+    return 1.0 if white_won == (record['white'] == 'engine1') else 0.0
+
+
+def elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_estimate(wins, draws, losses):
+    # Elo difference of engine1 over engine2 with a 95% interval, from the
+    # per-game score variance
+    games = wins + draws + losses
+    if not games:
+        return 0.0, 0.0, 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2
+                + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo(score), elo(score - margin), elo(score + margin)
+
+
+def tasks(n_games, openings, configs):
+    for game in range(n_games):
+        yield game, openings[(game // 2) % len(openings)], game % 2 == 0, configs
+
+
+def run_match(configs, n_games, openings=OPENINGS, processes=None, output=None):
+    wins = draws = losses = 0
+    nodes = [0, 0]
+    search_time = [0.0, 0.0]
+    start = time.perf_counter()
+
+    stream = open(output, 'a') if output else None
+    try:
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            for record in pool.imap_unordered(play_game, tasks(n_games, openings, configs)):
+                if stream:
+                    stream.write(json.dumps(record) + '\n')
+                    stream.flush()
+
+                score = engine1_score(record)
+                if score == 1:
+                    wins += 1
+                elif score == 0:
+                    losses += 1
+                else:
+                    draws += 1
+                for i in (0, 1):
+                    nodes[i] += record['nodes'][i]
+                    search_time[i] += record['time'][i]
+                print(f"game {record['game'] + 1}: {record['white']} white, {record['result']} "
+                      f"({record['reason']}, {len(record['moves'])} plies)  "
+                      f'+{wins} ={draws} -{losses}')
+    finally:
+        if stream:
+            stream.close()
+
+    return {
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'elo': elo_estimate(wins, draws, losses),
+        'nps': [nodes[i] / search_time[i] if search_time[i] else 0.0 for i in (0, 1)],
+        'time': time.perf_counter() - start,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play two engine configurations against '
+                                                 'each other.')
+    parser.add_argument('--engine1', nargs='*', default=[], metavar='OPTION',
+                        help='Engine keyword arguments, e.g. node_limit=5000')
+    parser.add_argument('--engine2', nargs='*', default=[], metavar='OPTION')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--openings', help='file with one FEN per line')
+    parser.add_argument('--processes', type=int, help='worker processes, default one per core')
+    parser.add_argument('--output', help='JSON lines file the games are appended to')
+    args = parser.parse_args(argv)
+
+    # Fixed limits by default, so results do not depend on machine load
+    defaults = {'time_limit': float('inf'), 'node_limit': 2000}
+    configs = [dict(defaults, **parse_config(args.engine1)),
+               dict(defaults, **parse_config(args.engine2))]
+
+    openings = OPENINGS
+    if args.openings:
+        with open(args.openings) as f:
+            openings = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    summary = run_match(configs, args.games, openings, args.processes, args.output)
+    elo_diff, elo_low, elo_high = summary['elo']
+    print(f"engine1 vs engine2: +{summary['wins']} ={summary['draws']} -{summary['losses']}")
+    print(f'elo: {elo_diff:+.0f} (95% interval {elo_low:+.0f} to {elo_high:+.0f})')
+    print(f"nodes/s: engine1 {summary['nps'][0]:.0f}, engine2 {summary['nps'][1]:.0f}")
+    print(f"time: {summary['time']:.1f}s, {args.games / summary['time']:.2f} games/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
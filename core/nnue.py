@@ -0,0 +1,154 @@
+import struct
+
+import numpy as np
+
+# Efficiently updatable network: 768 piece-square inputs per perspective,
+# a first layer of HIDDEN units whose sums (the accumulator) are kept up to
+# date as pieces come and go, then a dense HIDDEN2 layer and one output.
+# The accumulator holds both perspectives. Each sees its own pieces as
+# kinds 0-5 and the other side's as 6-11, with the board flipped for
+# black, so one set of weights serves both. The side to move's half comes
+# first into the dense layers.
+#
+# Weights are int16 and sums int32, scaled as in the float network:
+# first layer by QA, dense weights by QB, dense biases by QA * QB. The
+# output times WDL_SCALE is centipawns, and sigmoid(output) the expected
+# score, which is what the trainer fits.
+
+INPUTS = 768
+HIDDEN = 128
+HIDDEN2 = 32
+QA = 255
+QB = 64
+WDL_SCALE = 400
+
+MAGIC = b'NNUE'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')  # magic, version, HIDDEN, HIDDEN2
+
+
+def feature(perspective, piece, sq):
+    # Input index of piece on sq as seen by perspective
+    color, kind = divmod(piece, 6)
+    relative = kind if color == perspective else kind + 6
+    return relative * 64 + (sq if perspective == 0 else sq ^ 56)
+
+
+FEATURES = [[feature(perspective, piece, sq) for piece in range(12) for sq in range(64)]
+            for perspective in (0, 1)]
+
+
+class Network():
+    def __init__(self, w1, b1, w2, b2, w3, b3):
+        # Quantized layers: w1 (INPUTS, hidden) int16, b1 (hidden,) int16,
+        # w2 (2 * hidden, hidden2) int16, b2 (hidden2,) int32,
+        # w3 (hidden2,) int16, b3 int32
+        self.w1, self.b1, self.w2, self.b2, self.w3, self.b3 = w1, b1, w2, b2, w3, int(b3)
+        self.hidden, self.hidden2 = w2.shape[0] // 2, w2.shape[1]
+        # Row piece * 64 + sq adds a piece to both halves of the accumulator.
+        # int32 like the sums: 32 pieces of int16 weights overflow int16.
+        self.rows = np.stack([w1[FEATURES[0]], w1[FEATURES[1]]], axis=1).astype(np.int32)
+        # The dense layers run as float32 matrix products, which are several
+        # times faster than integer ones and exact while no sum can pass
+        # 2**24. Larger weights fall back to int32.
+        largest = max(QA * int(np.abs(w2).sum(axis=0).max()) + int(np.abs(b2).max()),
+                      QA * int(np.abs(w3).sum()) + abs(self.b3))
+        dtype = np.float32 if largest < 1 << 24 else np.int32
+        self.dense = (w2.astype(dtype), b2.astype(dtype), w3.astype(dtype))
+        self.biases = np.stack([b1, b1]).astype(np.int32)
+
+    @classmethod
+    def from_float(cls, w1, b1, w2, b2, w3, b3):
+        def quantize(values, scale, dtype):
+            info = np.iinfo(dtype)
+            return np.clip(np.round(np.asarray(values) * scale), info.min, info.max).astype(dtype)
+
+        return cls(quantize(w1, QA, np.int16), quantize(b1, QA, np.int16),
+                   quantize(w2, QB, np.int16), quantize(b2, QA * QB, np.int32),
+                   quantize(w3, QB, np.int16), quantize(b3, QA * QB, np.int32))
+
+    @classmethod
+    def random(cls, hidden=HIDDEN, hidden2=HIDDEN2, seed=0, scale=0.1):
+        # Untrained network, for tests and speed measurements. A large scale
+        # saturates the int16 first layer weights.
+        rng = np.random.default_rng(seed)
+        return cls.from_float(rng.normal(0, scale, (INPUTS, hidden)), np.zeros(hidden),
+                              rng.normal(0, 0.1, (2 * hidden, hidden2)), np.zeros(hidden2),
+                              rng.normal(0, 0.1, hidden2), 0.0)
+
+    def accumulator(self, gamestate):
+        # Accumulator for the pieces on the board, for when there is no
+        # previous position to update from
+        accumulator = Accumulator(self)
+        for sq, piece in enumerate(gamestate.squares):
+            if piece is not None:
+                accumulator.add(piece, sq)
+        return accumulator
+
+    def evaluate(self, values, side):
+        # Centipawns for side from the (2, hidden) accumulator values.
+        # minimum and maximum are quicker than np.clip on arrays this small.
+        w2, b2, w3 = self.dense
+        if side:
+            values = values[::-1]
+        hidden = np.minimum(np.maximum(values, 0), QA).reshape(-1).astype(w2.dtype) @ w2 + b2
+        hidden = np.minimum(np.maximum(hidden // QB, 0), QA)
+        return (int(hidden @ w3) + self.b3) * WDL_SCALE // (QA * QB)
+
+
+def check_accumulator(network, gamestate):
+    # The incremental accumulator of gamestate against sums of the weights
+    # in int64, which cannot overflow
+    side_rows = [[FEATURES[perspective][piece * 64 + sq]
+                  for sq, piece in enumerate(gamestate.squares) if piece is not None]
+                 for perspective in (0, 1)]
+    expected = np.stack([network.b1.astype(np.int64) + network.w1[rows].astype(np.int64).sum(0)
+                         for rows in side_rows])
+    assert np.array_equal(gamestate.accumulator.values, expected), \
+        'incremental accumulator != recomputed'
+
+
+class Accumulator():
+    # First layer sums of the position a game state is in. The game state
+    # calls add and remove for every piece that comes or goes, so make and
+    # unmake update it in place.
+    def __init__(self, network):
+        self.rows = network.rows
+        self.values = network.biases.copy()
+
+    def add(self, piece, sq):
+        self.values += self.rows[piece * 64 + sq]
+
+    def remove(self, piece, sq):
+        self.values -= self.rows[piece * 64 + sq]
+
+
+def save_network(network, path):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, network.hidden, network.hidden2))
+        for array, dtype in ((network.w1, '<i2'), (network.b1, '<i2'), (network.w2, '<i2'),
+                             (network.b2, '<i4'), (network.w3, '<i2'),
+                             (np.array([network.b3]), '<i4')):
+            f.write(array.astype(dtype).tobytes())
+
+
+def load_network(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, hidden, hidden2 = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not a version {VERSION} network file')
+    arrays = []
+    offset = HEADER.size
+    # frombuffer raises ValueError on a file cut short
+    for shape, dtype in (((INPUTS, hidden), '<i2'), ((hidden,), '<i2'),
+                         ((2 * hidden, hidden2), '<i2'), ((hidden2,), '<i4'),
+                         ((hidden2,), '<i2'), ((1,), '<i4')):
+        count = int(np.prod(shape))
+        array = np.frombuffer(data, dtype, count, offset).reshape(shape)
+        arrays.append(array.astype(np.int16 if dtype == '<i2' else np.int32))
+        offset += count * array.itemsize
+    if offset != len(data):
+        raise ValueError(f'{path} has {len(data) - offset} bytes after the network')
+    w1, b1, w2, b2, w3, b3 = arrays
+    return Network(w1, b1, w2, b2, w3, b3[0])
@@ -0,0 +1,108 @@
+# Pawn structure terms, as (middlegame, endgame) scores from White's point
+# of view. They depend on nothing but the pawns, and pawns move rarely, so
+# PawnTable caches them by the game state's pawn-only Zobrist key. Squares
+# are numbered like the bitboard backend: a8 is 0, White moves to lower y.
+
+FILE_A = 0x0101010101010101
+FILES = [FILE_A << x for x in range(8)]
+ADJACENT_FILES = [(FILES[x - 1] if x > 0 else 0) | (FILES[x + 1] if x < 7 else 0)
+                  for x in range(8)]
+
+# Penalty per extra pawn on a file, and per pawn with no friendly pawn on a
+# neighbouring file
+DOUBLED = (-10, -25)
+ISOLATED = (-8, -15)
+# Bonus for a passed pawn by rank counted from its own side, 1 = start rank
+PASSED_MG = (0, 5, 10, 15, 30, 50, 80, 0)
+PASSED_EG = (0, 10, 15, 25, 45, 75, 120, 0)
+
+PAWN_TABLE_ENTRIES = 1 << 14
+
+
+def _passed_masks():
+    # PASSED_MASKS[color][sq]: squares ahead of a pawn on sq, on its own and
+    # the neighbouring files, that no enemy pawn may stand on for it to be
+    # passed
+    masks = ([], [])
+    for sq in range(64):
+        x, y = sq & 7, sq >> 3
+        files = FILES[x] | ADJACENT_FILES[x]
+        masks[0].append(files & ((1 << (y * 8)) - 1))
+        masks[1].append(files & ~((1 << ((y + 1) * 8)) - 1) & ((1 << 64) - 1))
+    return masks
+
+
+PASSED_MASKS = _passed_masks()
+
+
+def pawn_structure(white_pawns, black_pawns):
+    mg = eg = 0
+    for color, own, enemy, sign in ((0, white_pawns, black_pawns, 1),
+                                    (1, black_pawns, white_pawns, -1)):
+        for x in range(8):
+            on_file = own & FILES[x]
+            if not on_file:
+                continue
+            count = bin(on_file).count('1')
+            if count > 1:
+                mg += sign * DOUBLED[0] * (count - 1)
+                eg += sign * DOUBLED[1] * (count - 1)
+            if not own & ADJACENT_FILES[x]:
+                mg += sign * ISOLATED[0] * count
+                eg += sign * ISOLATED[1] * count
+
+        passed_masks = PASSED_MASKS[color]
+        bb = own
+        while bb:
+            low = bb & -bb
+            sq = low.bit_length() - 1
+            bb ^= low
+            # Of doubled pawns only the front one can be passed, the
+            # others are blocked by it
+            if not enemy & passed_masks[sq] and not own & passed_masks[sq] & FILES[sq & 7]:
+                rank = 7 - (sq >> 3) if color == 0 else sq >> 3
+                mg += sign * PASSED_MG[rank]
+                eg += sign * PASSED_EG[rank]
+    return mg, eg
+
+
+class PawnTable():
+    # Fixed number of entries indexed by the low bits of the pawn key. A
+    # new structure simply replaces whatever was in its slot.
+    def __init__(self, entries=PAWN_TABLE_ENTRIES):
+        assert entries & (entries - 1) == 0, 'entries must be a power of two'
+        self.mask = entries - 1
+        self.entries = [None] * entries
+        self.reset_counters()
+
+    def clear(self):
+        self.entries = [None] * (self.mask + 1)
+
+    def reset_counters(self):
+        self.probes = 0
+        self.hits = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def terms(self, key, white_pawns, black_pawns):
+        # Cached pawn_structure() of the position with this pawn key
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        terms = pawn_structure(white_pawns, black_pawns)
+        self.entries[key & self.mask] = (key, terms)
+        return terms
+
+    def stats(self):
+        used = sum(entry is not None for entry in self.entries)
+        return {
+            'entries': self.mask + 1,
+            'used': used,
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': round(self.hit_rate, 4),
+        }
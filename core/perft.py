@@ -0,0 +1,116 @@
+import argparse
+import sys
+import time
+
+from core.bitboard import BitboardGameState, STARTING_FEN, move_to_uci
+
+# Standard reference positions with their known node counts for depth 1, 2, ...
+# (from the Chess Programming Wiki perft results page)
+SUITE = [
+    ('initial', STARTING_FEN,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603, 193690690]),
+    ('position 3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ('position 4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333, 15833292]),
+    ('position 4 mirrored', 'r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1',
+     [6, 264, 9467, 422333, 15833292]),
+    ('position 5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487, 89941194]),
+    ('position 6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+def perft(gamestate, depth):
+    # Leaf nodes at depth. The last ply is counted from the legal move list
+    # without playing the moves.
+    if depth <= 0:
+        return 1
+    moves = gamestate.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gamestate.make_move(move)
+        nodes += perft(gamestate, depth - 1)
+        gamestate.unmake_move()
+    return nodes
+
+
+def divide(gamestate, depth):
+    # Leaf nodes below each root move, for finding which move is off
+    if depth < 1:
+        raise ValueError(f'divide needs a depth of at least 1, not {depth}')
+    counts = {}
+    for move in gamestate.legal_moves():
+        gamestate.make_move(move)
+        counts[move_to_uci(move)] = perft(gamestate, depth - 1)
+        gamestate.unmake_move()
+    return counts
+
+
+def timed_perft(fen, depth):
+    gamestate = BitboardGameState.from_fen(fen)
+    start = time.perf_counter()
+    nodes = perft(gamestate, depth)
+    return nodes, time.perf_counter() - start
+
+
+def run_suite(max_nodes=1000000):
+    # Every position to the deepest depth whose known count fits under
+    # max_nodes. Returns True when all counts match.
+    passed = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in SUITE:
+        for depth, expected in enumerate(counts, 1):
+            if expected > max_nodes:
+                break
+            nodes, elapsed = timed_perft(fen, depth)
+            total_nodes += nodes
+            total_time += elapsed
+            status = 'ok' if nodes == expected else f'FAIL (expected {expected})'
+            passed = passed and nodes == expected
+            print(f'{name:20} depth {depth}: {nodes:>10} nodes {elapsed:7.2f}s '
+                  f'{nodes / max(elapsed, 1e-9):>9.0f} nps  {status}')
+    print(f'total: {total_nodes} nodes in {total_time:.2f}s, '
+          f'{total_nodes / max(total_time, 1e-9):.0f} nps')
+    return passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count move generator leaf nodes.')
+    parser.add_argument('depth', nargs='?', type=int, default=4)
+    parser.add_argument('--fen', default=STARTING_FEN)
+    parser.add_argument('--divide', action='store_true', help='count per root move')
+    parser.add_argument('--suite', action='store_true', help='run the reference positions')
+    parser.add_argument('--max-nodes', type=int, default=1000000,
+                        help='deepest suite depth to run, by known node count')
+    args = parser.parse_args(argv)
+    if args.depth < 1:
+        parser.error('depth must be at least 1')
+
+    if args.suite:
+        return 0 if run_suite(args.max_nodes) else 1
+
+    gamestate = BitboardGameState.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(gamestate, args.depth)
+        for uci, nodes in sorted(counts.items()):
+            print(f'{uci}: {nodes}')
+        nodes = sum(counts.values())
+        print(f'moves: {len(counts)}')
+    else:
+        nodes = perft(gamestate, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f'nodes: {nodes}')
+    print(f'time: {elapsed:.3f}s, {nodes / max(elapsed, 1e-9):.0f} nps')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import re
+from dataclasses import dataclass, field
+
+from core.bitboard import (BitboardGameState, PAWN, KNIGHT, QUEEN, KING, CAPTURE, PROMOTION,
+                           KING_CASTLE, QUEEN_CASTLE, square_name)
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+SAN_CHARS = 'PNBRQK'
+
+TAG = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQnbrq]))?$')
+# Comments, variations, NAGs and move numbers, which are skipped over
+MOVETEXT_TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|\(|\)|\$\d+|\d+\.+|[^\s(){};]+')
+
+
+@dataclass
+class PgnGame:
+    headers: dict = field(default_factory=dict)
+    movetext: str = ''
+
+    def gamestate(self):
+        fen = self.headers.get('FEN')
+        return BitboardGameState.from_fen(fen) if fen else BitboardGameState()
+
+    def san_moves(self):
+        # Mainline SAN moves, tokenized as they are consumed
+        depth = 0
+        for match in MOVETEXT_TOKEN.finditer(self.movetext):
+            token = match.group()
+            if token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            elif depth or token[0] in '{;$' or token[0].isdigit() and token.rstrip('.').isdigit():
+                continue
+            elif token in RESULTS:
+                return
+            else:
+                yield token
+
+    def replay(self):
+        # (gamestate, move, san) before each move is played. The same
+        # gamestate object is updated in place.
+        gamestate = self.gamestate()
+        for san in self.san_moves():
+            move = parse_san(gamestate, san)
+            yield gamestate, move, san
+            gamestate.make_move(move)
+
+
+def read_games(lines):
+    # PgnGames from an iterable of lines, e.g. an open file, one at a time
+    headers = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        if movetext and (not line or line.startswith('[')):
+            yield PgnGame(headers, ' '.join(movetext))
+            headers, movetext = {}, []
+        if line.startswith('['):
+            match = TAG.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"')
+        elif line and not line.startswith('%'):
+            movetext.append(line)
+    if movetext or headers:
+        yield PgnGame(headers, ' '.join(movetext))
+
+
+def parse_san(gamestate, san):
+    san = san.rstrip('+#!?')
+    moves = gamestate.legal_moves()
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        flag = KING_CASTLE if len(san) == 3 else QUEEN_CASTLE
+        for move in moves:
+            if move >> 12 == flag:
+                return move
+        raise ValueError(f'Illegal move {san!r} in {gamestate.to_fen()}')
+
+    match = SAN.match(san)
+    if not match:
+        raise ValueError(f'Invalid SAN {san!r}')
+    piece, from_file, from_rank, to, promotion = match.groups()
+    kind = SAN_CHARS.index(piece) if piece else PAWN
+    to_sq = ('abcdefgh'.index(to[0])) + (8 - int(to[1])) * 8
+    promoted = SAN_CHARS.index(promotion.upper()) if promotion else None
+
+    candidates = []
+    for move in moves:
+        from_sq = move & 63
+        if (move >> 6) & 63 != to_sq or gamestate.squares[from_sq] % 6 != kind:
+            continue
+        if from_file and 'abcdefgh'[from_sq & 7] != from_file:
+            continue
+        if from_rank and str(8 - (from_sq >> 3)) != from_rank:
+            continue
+        flag = move >> 12
+        if flag & PROMOTION:
+            if promoted is None:
+                promoted = QUEEN  # a bare e8 promotes to a queen
+            if (flag & 3) + KNIGHT != promoted:
+                continue
+        candidates.append(move)
+    if len(candidates) != 1:
+        reason = 'Ambiguous' if candidates else 'Illegal'
+        raise ValueError(f'{reason} move {san!r} in {gamestate.to_fen()}')
+    return candidates[0]
+
+
+def move_to_san(gamestate, move):
+    from_sq, to_sq, flag = move & 63, (move >> 6) & 63, move >> 12
+    if flag == KING_CASTLE:
+        san = 'O-O'
+    elif flag == QUEEN_CASTLE:
+        san = 'O-O-O'
+    else:
+        kind = gamestate.squares[from_sq] % 6
+        capture = 'x' if flag & CAPTURE else ''
+        if kind == PAWN:
+            san = (square_name(from_sq)[0] if capture else '') + capture + square_name(to_sq)
+            if flag & PROMOTION:
+                san += '=' + SAN_CHARS[(flag & 3) + KNIGHT]
+        else:
+            # Disambiguate by file, then rank, then both
+            others = [other & 63 for other in gamestate.legal_moves()
+                      if other != move and (other >> 6) & 63 == to_sq
+                      and gamestate.squares[other & 63] % 6 == kind]
+            prefix = ''
+            if others and kind != KING:
+                name = square_name(from_sq)
+                if all(other & 7 != from_sq & 7 for other in others):
+                    prefix = name[0]
+                elif all(other >> 3 != from_sq >> 3 for other in others):
+                    prefix = name[1]
+                else:
+                    prefix = name
+            san = SAN_CHARS[kind] + prefix + capture + square_name(to_sq)
+
+    gamestate.make_move(move)
+    if gamestate.in_check():
+        san += '#' if not gamestate.legal_moves() else '+'
+    gamestate.unmake_move()
+    return san
+
+
+def game_to_pgn(headers, sans, result='*'):
+    lines = [f'[{name} "{value}"]' for name, value in headers.items()]
+    movetext = []
+    for ply, san in enumerate(sans):
+        if not ply & 1:
+            movetext.append(f'{ply // 2 + 1}.')
+        movetext.append(san)
+    movetext.append(result)
+    return '\n'.join(lines) + '\n\n' + ' '.join(movetext) + '\n\n'
@@ -0,0 +1,285 @@
+from array import array
+from itertools import islice
+
+import numpy as np
+
+from core.bitboard import QUIET, DOUBLE_PUSH, CAPTURE, encode_move, square_to_pos
+from core.utils import KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS
+
+# More than the most pseudo-legal moves any position has (218)
+MAX_MOVES = 256
+
+
+# The generators copy prebuilt move ints from these tables into the buffer,
+# so generating moves allocates no new ints. Indexed [y][x] like the
+# tables they are built from.
+
+def _encoded(x, y, targets, flags=(QUIET, CAPTURE)):
+    # (x, y, quiet move, capture move) per target of the piece on x, y
+    from_sq = y * 8 + x
+    return [(x_, y_) + tuple(encode_move(from_sq, y_ * 8 + x_, flag) for flag in flags)
+            for x_, y_ in targets]
+
+
+def _pawn_moves(x, y, forward):
+    # (push, double push, ((x, capture), ...)) of a pawn on x, y
+    y_ = y + forward
+    if not 0 <= y_ < 8:
+        return None
+    from_sq = y * 8 + x
+    push = encode_move(from_sq, y_ * 8 + x)
+    double = encode_move(from_sq, from_sq + 16 * forward, DOUBLE_PUSH) \
+        if 0 <= y + 2 * forward < 8 else None
+    captures = tuple((x_, encode_move(from_sq, y_ * 8 + x_, CAPTURE))
+                     for x_ in (x - 1, x + 1) if 0 <= x_ < 8)
+    return push, double, captures
+
+
+KNIGHT_MOVES = [[_encoded(x, y, KNIGHT_TARGETS[y][x]) for x in range(8)] for y in range(8)]
+KING_MOVES = [[_encoded(x, y, KING_TARGETS[y][x]) for x in range(8)] for y in range(8)]
+ROOK_MOVES = [[[_encoded(x, y, ray) for ray in ROOK_RAYS[y][x]] for x in range(8)]
+              for y in range(8)]
+BISHOP_MOVES = [[[_encoded(x, y, ray) for ray in BISHOP_RAYS[y][x]] for x in range(8)]
+                for y in range(8)]
+PAWN_MOVES = {color: [[_pawn_moves(x, y, forward) for x in range(8)] for y in range(8)]
+              for color, forward in (('w', -1), ('b', 1))}
+
+
+class MoveBuffer():
+    # Moves of one position, encoded like the bitboard backend's, in an
+    # array allocated once and reused. Only the first count are valid.
+    def __init__(self, size=MAX_MOVES):
+        self.moves = array('H', bytes(2 * size))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return islice(self.moves, self.count)
+
+    def clear(self):
+        self.count = 0
+
+
+class Piece:
+    def __init__(self, color):
+        assert color == 'w' or color == 'b'
+        self.color = color
+        if color == 'w':
+            self.color_representation = 1
+        elif color == 'b':
+            self.color_representation = -1
+
+    def generate_moves(self, pos_from, gamestate, buffer):
+        # Appends the moves of this piece on pos_from to buffer
+        x, y = pos_from
+        buffer.count = self._generate_moves(x, y, gamestate, buffer.moves, buffer.count)
+        return buffer
+
+    def get_valid_moves(self, pos_from, gamestate):
+        # Destinations as (x, y), for callers that work in UI coordinates
+        buffer = self.generate_moves(pos_from, gamestate, _scratch)
+        targets = [square_to_pos((move >> 6) & 63) for move in buffer]
+        buffer.clear()
+        return targets
+
+    def _generate_steps(self, x, y, gamestate, moves, count, table):
+        position = gamestate.position
+        for x_, y_, quiet, capture in table[y][x]:
+            piece = position[y_][x_]
+            if piece is None:
+                moves[count] = quiet
+            elif piece.color != self.color:
+                moves[count] = capture
+            else:
+                continue
+            count += 1
+        return count
+
+    def _generate_rays(self, x, y, gamestate, moves, count, table):
+        position = gamestate.position
+        for ray in table[y][x]:
+            for x_, y_, quiet, capture in ray:
+                piece = position[y_][x_]
+                if piece is None:
+                    moves[count] = quiet
+                    count += 1
+                    continue
+                # Capture an enemy piece, stop at either
+                if piece.color != self.color:
+                    moves[count] = capture
+                    count += 1
+                break
+        return count
+
+    def __sum__(self, other):
+        return self.value + other
+
+
+# Used by get_valid_moves, which empties it again before returning
+_scratch = MoveBuffer()
+
+
+class King(Piece):
+    def __init__(self, color):
+        self.char = 'K'
+        super().__init__(color)
+        if self.color == 'w':
+            self.location = np.array([7, 4])
+        elif self.color == 'b':
+            self.location = np.array([0, 4])
+
+        self.value = 100000
+
+    def check_validity(self, x1, y1, x2, y2):
+        return abs(x1 - x2) <= 1 and abs(y1 - y2) <= 1
+
+    def _generate_moves(self, x, y, gamestate, moves, count):
+        return self._generate_steps(x, y, gamestate, moves, count, KING_MOVES)
+
+    def __str__(self):
+        return f'{self.color} King'
+
+    def copy(self):
+        return King(self.color)
+
+
+class Queen(Piece):
+    def __init__(self, color):
+        self.char = 'Q'
+        super().__init__(color)
+        self.value = 9
+
+    def check_validity(self, x1, y1, x2, y2):
+        # Bishop and rook validity with or
+        return (abs(x1 - x2) == abs(y1 - y2)) or (x1 == x2 or y1 == y2)
+
+    def _generate_moves(self, x, y, gamestate, moves, count):
+        count = self._generate_rays(x, y, gamestate, moves, count, ROOK_MOVES)
+        return self._generate_rays(x, y, gamestate, moves, count, BISHOP_MOVES)
+
+    def __str__(self):
+        return f'{self.color} Queen'
+
+    def copy(self):
+        return Queen(self.color)
+
+
+class Rook(Piece):
+    def __init__(self, color):
+        self.char = 'R'
+        super().__init__(color)
+        self.value = 5
+
+    def check_validity(self, x1, y1, x2, y2):
+        return x1 == x2 or y1 == y2
+
+    def _generate_moves(self, x, y, gamestate, moves, count):
+        return self._generate_rays(x, y, gamestate, moves, count, ROOK_MOVES)
+
+    def __str__(self):
+        return f'{self.color} Rook'
+
+    def copy(self):
+        return Rook(self.color)
+
+
+class Knight(Piece):
+    def __init__(self, color):
+        self.char = 'N'
+        super().__init__(color)
+        self.value = 3
+
+    def check_validity(self, x1, y1, x2, y2):
+        return set([abs(x1 - x2), abs(y1 - y2)]) == set([1, 2])
+
+    def _generate_moves(self, x, y, gamestate, moves, count):
+        return self._generate_steps(x, y, gamestate, moves, count, KNIGHT_MOVES)
+
+    def __str__(self):
+        return f'{self.color} Knight'
+
+    def copy(self):
+        return Knight(self.color)
+
+
+class Bishop(Piece):
+    def __init__(self, color):
+        self.char = 'B'
+        super().__init__(color)
+        self.value = 3
+
+    def check_validity(self, x1, y1, x2, y2):
+        return abs(x1 - x2) == abs(y1 - y2)
+
+    def _generate_moves(self, x, y, gamestate, moves, count):
+        return self._generate_rays(x, y, gamestate, moves, count, BISHOP_MOVES)
+
+    def __str__(self):
+        return f'{self.color} Bishop'
+
+    def copy(self):
+        return Bishop(self.color)
+
+
+class Pawn(Piece):
+    def __init__(self, color):
+        self.char = 'p'
+        self.has_moved = False
+        super().__init__(color)
+        self.value = 1
+
+    def check_validity(self, x1, y1, x2, y2):
+        if x1 == x2:
+            if not self.has_moved:
+                self.has_moved = True
+                if self.color == 'w':
+                    if y1 - y2 in [1, 2]:
+                        return True
+                elif self.color == 'b':
+                    if y1 - y2 in [-1, -2]:
+                        return True
+            else:
+                if self.color == 'w':
+                    if y1 - y2 == 1:
+                        return True
+                elif self.color == 'b':
+                    if y1 - y2 == -1:
+                        return True
+        return False
+
+    def _generate_moves(self, x, y, gamestate, moves, count):
+        # MISSING EN PASSENT
+        pawn_moves = PAWN_MOVES[self.color][y][x]
+        if pawn_moves is None:
+            return count
+        push, double, captures = pawn_moves
+        position = gamestate.position
+        forward = -1 if self.color == 'w' else 1
+        row = position[y + forward]
+
+        if row[x] is None:
+            moves[count] = push
+            count += 1
+        for x_, capture in captures:
+            piece = row[x_]
+            if piece is not None and piece.color != self.color:
+                moves[count] = capture
+                count += 1
+
+        # Both squares must be empty, the pawn cannot jump a blocker
+        if (not self.has_moved and double is not None and row[x] is None
+                and position[y + 2 * forward][x] is None):
+            moves[count] = double
+            count += 1
+        return count
+
+    def __str__(self):
+        return f'{self.color} Pawn'
+
+    def copy(self):
+        new_pawn = Pawn(self.color)
+        if self.has_moved:
+            new_pawn.has_moved = True
+        return new_pawn
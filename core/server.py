@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from core.bitboard import BitboardGameState, STARTING_FEN, move_to_uci, parse_uci_move
+from core.engine import Engine
+
+log = logging.getLogger(__name__)
+
+# Line protocol, one request and one reply per line:
+#   new [fen <fen>]      ok <id>
+#   move <id> <uci>      ok <id>              plays a move for the client
+#   go <id>              bestmove <id> <uci>  the engine plays its move,
+#                                             0000 when there is none
+#   fen <id>             fen <id> <fen>
+#   close <id>           ok <id>
+#   quit                 the server closes the connection
+# Anything that fails gets "error <reason>". A go refused because the
+# engine queue is full gets "busy <id>" and may be sent again later.
+# Requests on one connection are handled in order, so a client playing
+# many games at once opens a connection per game or waits for replies.
+
+# Searches allowed to wait for a free worker, per worker
+WAITING_PER_PROCESS = 4
+MAX_SESSIONS = 10000
+
+# Set in each worker process by _init_worker
+_engine = None
+
+
+def _init_worker(engine_options):
+    global _engine
+    _engine = Engine(**engine_options)
+
+
+def _search(data):
+    return _engine.search(pickle.loads(data))
+
+
+class Session():
+    def __init__(self, session_id, fen=STARTING_FEN):
+        self.id = session_id
+        self.gamestate = BitboardGameState.from_fen(fen)
+        # True while a search for this session is waiting or running, the
+        # game cannot change until it is done
+        self.thinking = False
+
+
+class EngineScheduler():
+    # Runs searches in a process pool. A session has at most one search
+    # waiting or running, and waiting searches start in arrival order, so
+    # the sessions share the workers round robin and a client sending go
+    # as fast as it can gets no more than its turn. Past max_waiting
+    # waiting searches new ones are refused, so a burst turns into busy
+    # replies rather than ever longer waits.
+    def __init__(self, processes=None, engine_options=None, max_waiting=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.pool = ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(engine_options or {},))
+        self.queue = asyncio.Queue(max_waiting or self.processes * WAITING_PER_PROCESS)
+        self.dispatchers = [asyncio.create_task(self._dispatch())
+                            for _ in range(self.processes)]
+        self.searches = 0
+        self.refused = 0
+
+    async def _dispatch(self):
+        # One dispatcher per worker, so a search only leaves the queue when
+        # a worker is free to take it
+        loop = asyncio.get_running_loop()
+        while True:
+            data, future = await self.queue.get()
+            try:
+                move = await loop.run_in_executor(self.pool, _search, data)
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                if not future.done():
+                    future.set_result(move)
+
+    def submit(self, session):
+        # Future of the session's engine move, or None when the queue is full
+        if self.queue.full():
+            self.refused += 1
+            return None
+        future = asyncio.get_running_loop().create_future()
+        # Pickled now, the pool would only do it later from another thread
+        self.queue.put_nowait((pickle.dumps(session.gamestate), future))
+        self.searches += 1
+        return future
+
+    def close(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+
+class GameServer():
+    def __init__(self, processes=None, engine_options=None, max_waiting=None,
+                 max_sessions=MAX_SESSIONS):
+        self.processes = processes
+        self.engine_options = engine_options
+        self.max_waiting = max_waiting
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        self.scheduler = None
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None, ready=None):
+        # Serves until cancelled, on a Unix socket when path is given.
+        # ready is called with the listening server once it accepts.
+        self.scheduler = EngineScheduler(self.processes, self.engine_options, self.max_waiting)
+        try:
+            if path:
+                server = await asyncio.start_unix_server(self.handle_client, path)
+            else:
+                server = await asyncio.start_server(self.handle_client, host, port)
+            async with server:
+                if ready is not None:
+                    ready(server)
+                await server.serve_forever()
+        finally:
+            self.scheduler.close()
+
+    async def handle_client(self, reader, writer):
+        # Sessions belong to the connection that made them and go with it
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if line == 'quit':
+                    break
+                reply = await self.handle(line, owned)
+                if reply is not None:
+                    writer.write(reply.encode() + b'\n')
+                    # Stop reading from a client that does not read its
+                    # replies
+                    await writer.drain()
+        except (ConnectionError, UnicodeDecodeError) as error:
+            log.debug('client dropped: %s', error)
+        finally:
+            for session_id in owned:
+                self.sessions.pop(session_id, None)
+            writer.close()
+
+    async def handle(self, line, owned):
+        tokens = line.split()
+        if not tokens:
+            return None
+        command, args = tokens[0], tokens[1:]
+        if command == 'new':
+            if len(self.sessions) >= self.max_sessions:
+                return 'error too many sessions'
+            fen = ' '.join(args[1:]) if args[:1] == ['fen'] else STARTING_FEN
+            try:
+                session = Session(next(self.ids), fen)
+            except (ValueError, IndexError, KeyError) as error:
+                return f'error invalid fen: {error}'
+            self.sessions[session.id] = session
+            owned.add(session.id)
+            return f'ok {session.id}'
+        if command not in ('move', 'go', 'fen', 'close'):
+            return f'error unknown command {command}'
+
+        session = None
+        if args and args[0].isdigit() and int(args[0]) in owned:
+            session = self.sessions[int(args[0])]
+        if session is None:
+            return f'error no such session {" ".join(args[:1])}'
+        if command == 'fen':
+            return f'fen {session.id} {session.gamestate.to_fen()}'
+        if session.thinking:
+            return f'error {session.id} is searching'
+        if command == 'close':
+            del self.sessions[session.id]
+            owned.discard(session.id)
+            return f'ok {session.id}'
+        if command == 'move':
+            try:
+                session.gamestate.make_move(parse_uci_move(session.gamestate, args[1]))
+            except (ValueError, IndexError, KeyError):
+                return f'error illegal move {" ".join(args[1:2])}'
+            return f'ok {session.id}'
+        return await self.engine_move(session)
+
+    async def engine_move(self, session):
+        if not session.gamestate.legal_moves():
+            return f'bestmove {session.id} 0000'
+        future = self.scheduler.submit(session)
+        if future is None:
+            return f'busy {session.id}'
+        session.thinking = True
+        try:
+            move = await future
+        finally:
+            session.thinking = False
+        session.gamestate.make_move(move)
+        return f'bestmove {session.id} {move_to_uci(move)}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve many games over a line protocol.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this Unix socket instead')
+    parser.add_argument('--processes', type=int, help='engine processes, default one per core')
+    parser.add_argument('--nodes', type=int, default=1000, help='search nodes per engine move')
+    parser.add_argument('--max-waiting', type=int,
+                        help=f'searches waiting for a worker before go is refused, '
+                             f'default {WAITING_PER_PROCESS} per process')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    server = GameServer(args.processes, {'time_limit': float('inf'), 'node_limit': args.nodes},
+                        args.max_waiting)
+    where = args.unix or f'{args.host}:{args.port}'
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix,
+                                 ready=lambda _: log.info('listening on %s', where)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import multiprocessing
+import pickle
+import queue
+import time
+from multiprocessing import shared_memory
+
+from core.engine import Engine, SearchInfo, MAX_PLY, SELECTIVE
+from core.transposition import TranspositionTable, table_bytes
+from core.worker import WorkerEngine
+
+
+def _serve_helper(index, requests, results, stop_id, table_name, engine_options):
+    table = shared_memory.SharedMemory(name=table_name)
+    hash_mb = engine_options.pop('hash_mb')
+    engine = WorkerEngine(stop_id, stop_id, tt=TranspositionTable(hash_mb, table.buf),
+                          **engine_options)
+    # Every other helper searches one ply deeper, so the helpers are not
+    # all working on the same iteration
+    engine.depth_offset = index & 1
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            request_id, data = request
+            engine.request_id = request_id
+            move = engine.search(pickle.loads(data))
+            results.put((request_id, index, move, engine.info))
+    finally:
+        engine.tt.keys.release()
+        engine.tt.data.release()
+        table.close()
+
+
+class ParallelEngine(Engine):
+    # Lazy SMP: the helpers search the same root as this process and share
+    # its transposition table through shared memory, so they mostly fill
+    # the table for each other. When this process is done it stops them and
+    # the deepest finished iteration among all of them is played.
+    def __init__(self, threads=2, time_limit=1.0, node_limit=None, max_depth=MAX_PLY - 1,
+                 hash_mb=16, selective=SELECTIVE, book=None, tablebases=None, network=None):
+        self.table = shared_memory.SharedMemory(create=True, size=table_bytes(hash_mb))
+        super().__init__(time_limit, node_limit, max_depth,
+                         tt=TranspositionTable(hash_mb, self.table.buf), book=book,
+                         tablebases=tablebases, selective=selective, network=network)
+        self.threads = threads
+        # Books and tablebases are memory-mapped, so the helpers get their
+        # paths and map the same files. A network is pickled.
+        helper_options = {'time_limit': float('inf'), 'max_depth': max_depth,
+                          'hash_mb': hash_mb, 'selective': selective,
+                          'book': getattr(book, 'path', book),
+                          'tablebases': getattr(tablebases, 'directory', tablebases),
+                          'network': network}
+
+        context = multiprocessing.get_context('spawn')
+        self.results = context.Queue()
+        self.stop_id = context.Value('q', 0, lock=False)
+        self.request_id = 0
+        self.helper_requests = []
+        self.helpers = []
+        for index in range(1, threads):
+            requests = context.Queue()
+            helper = context.Process(
+                target=_serve_helper, daemon=True,
+                args=(index, requests, self.results, self.stop_id, self.table.name,
+                      helper_options))
+            helper.start()
+            self.helper_requests.append(requests)
+            self.helpers.append(helper)
+
+    def search(self, gamestate, ponder=False):
+        self.request_id += 1
+        data = pickle.dumps(gamestate)
+        for requests in self.helper_requests:
+            requests.put((self.request_id, data))
+
+        move = super().search(gamestate, ponder)
+        self.stop_id.value = self.request_id
+
+        best = self.info
+        nodes = self.nodes
+        pending = set(range(1, self.threads))
+        while pending:
+            try:
+                request_id, index, helper_move, info = self.results.get(timeout=1)
+            except queue.Empty:
+                # Do not wait on helpers that died
+                pending = {index for index in pending if self.helpers[index - 1].is_alive()}
+                continue
+            if request_id != self.request_id:
+                continue
+            pending.discard(index)
+            nodes += info.nodes
+            if info.depth > best.depth and info.pv and helper_move is not None:
+                best = info
+                move = helper_move
+
+        self.info = SearchInfo(best.depth, best.score, nodes,
+                               time.perf_counter() - self.search_start, list(best.pv))
+        return move
+
+    def close(self):
+        for requests in self.helper_requests:
+            requests.put(None)
+        for helper in self.helpers:
+            helper.join(timeout=1)
+            if helper.is_alive():
+                helper.terminate()
+        self.helpers = []
+        self.helper_requests = []
+        self.tt.keys.release()
+        self.tt.data.release()
+        self.table.close()
+        self.table.unlink()
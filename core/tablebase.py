@@ -0,0 +1,441 @@
+import argparse
+import itertools
+import mmap
+import os
+import sys
+import time
+
+from core.bitboard import (WHITE, BLACK, KNIGHT, BISHOP, ROOK, QUEEN, KING, BIT, BIT_BETWEEN,
+                           KNIGHT_ATTACKS, KING_ATTACKS, bishop_attacks, rook_attacks,
+                           queen_attacks, iter_bits)
+
+# Distance-to-mate tables for pawnless endings, one byte per position:
+# 0 is a draw, 255 a position that is illegal or not in canonical form, and
+# anything else is plies to mate + 1. An odd number of plies means the side
+# to move mates, an even number that it gets mated.
+HEADER = b'NINJATB1'
+DRAW = 0
+INVALID = 255
+MAX_PLIES = 253
+
+# Piece letters in table names, strongest first
+KIND_CHARS = {QUEEN: 'Q', ROOK: 'R', BISHOP: 'B', KNIGHT: 'N'}
+CHAR_KINDS = {char: kind for kind, char in KIND_CHARS.items()}
+
+THREE_PIECE = ['KQvK', 'KRvK', 'KBvK', 'KNvK']
+FOUR_PIECE = ['KQvKQ', 'KQvKR', 'KQvKB', 'KQvKN', 'KRvKR', 'KRvKB', 'KRvKN', 'KBvKB',
+              'KBvKN', 'KNvKN', 'KQQvK', 'KQRvK', 'KQBvK', 'KQNvK', 'KRRvK', 'KRBvK',
+              'KRNvK', 'KBBvK', 'KBNvK', 'KNNvK']
+
+
+def _transforms():
+    # The 8 symmetries of the board as square maps. Without pawns or castling
+    # rights every one of them keeps the position's value.
+    transforms = []
+    for flip_x, flip_y, swap in itertools.product((0, 7), (0, 7), (False, True)):
+        table = []
+        for sq in range(64):
+            x, y = (sq & 7) ^ flip_x, (sq >> 3) ^ flip_y
+            if swap:
+                x, y = y, x
+            table.append(y * 8 + x)
+        transforms.append(table)
+    return transforms
+
+
+TRANSFORMS = _transforms()
+# The white king is always moved into this triangle: x <= 3, y <= x
+TRIANGLE = [y * 8 + x for x in range(4) for y in range(x + 1)]
+TRIANGLE_INDEX = [TRIANGLE.index(sq) if sq in TRIANGLE else -1 for sq in range(64)]
+# Transforms taking a king square into the triangle. On the diagonal two of
+# them do, and the one giving the lower index wins.
+KING_TRANSFORMS = [[t for t in TRANSFORMS if t[sq] in TRIANGLE] for sq in range(64)]
+
+
+# Empty-board attacks, so a slider only needs the squares between it and a
+# target checked
+EMPTY_ATTACKS = {
+    KNIGHT: KNIGHT_ATTACKS,
+    BISHOP: [bishop_attacks(sq, 0) for sq in range(64)],
+    ROOK: [rook_attacks(sq, 0) for sq in range(64)],
+    QUEEN: [queen_attacks(sq, 0) for sq in range(64)],
+    KING: KING_ATTACKS,
+}
+
+
+def attacks_square(kind, sq, target, occ):
+    if not EMPTY_ATTACKS[kind][sq] & BIT[target]:
+        return False
+    return kind == KNIGHT or kind == KING or not BIT_BETWEEN[sq * 64 + target] & occ
+
+
+def piece_attacks(kind, sq, occ):
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if kind == BISHOP:
+        return bishop_attacks(sq, occ)
+    if kind == ROOK:
+        return rook_attacks(sq, occ)
+    if kind == QUEEN:
+        return queen_attacks(sq, occ)
+    return KING_ATTACKS[sq]
+
+
+def parse_name(name):
+    # 'KQvKR' -> [(WHITE, KING), (WHITE, QUEEN), (BLACK, KING), (BLACK, ROOK)]
+    strong, weak = name.split('v')
+    return [(WHITE, KING)] + [(WHITE, CHAR_KINDS[char]) for char in strong[1:]] \
+        + [(BLACK, KING)] + [(BLACK, CHAR_KINDS[char]) for char in weak[1:]]
+
+
+def side_name(kinds):
+    return 'K' + ''.join(KIND_CHARS[kind] for kind in sorted(kinds, reverse=True))
+
+
+def material_name(pieces):
+    # Table name for a list of (color, kind) and whether colors are swapped
+    kinds = [[kind for color, kind in pieces if color == c and kind != KING] for c in (WHITE, BLACK)]
+    white, black = side_name(kinds[WHITE]), side_name(kinds[BLACK])
+    return f'{white}v{black}', f'{black}v{white}'
+
+
+def table_path(directory, name):
+    return os.path.join(directory, f'{name}.ntb')
+
+
+class Table():
+    def __init__(self, name, values=None):
+        self.name = name
+        self.pieces = parse_name(name)
+        self.size = 10 * 64 ** (len(self.pieces) - 1)
+        self.values = values
+
+    def index(self, side, squares):
+        best = None
+        for transform in KING_TRANSFORMS[squares[0]]:
+            index = TRIANGLE_INDEX[transform[squares[0]]]
+            for sq in squares[1:]:
+                index = index * 64 + transform[sq]
+            if best is None or index < best:
+                best = index
+        return side * self.size + best
+
+    def value(self, side, squares):
+        return self.values[self.index(side, squares)]
+
+    def decode(self, index):
+        # (side, squares) of an index, as laid out by index()
+        side, index = divmod(index, self.size)
+        squares = []
+        for _ in range(len(self.pieces) - 1):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        squares.append(TRIANGLE[index])
+        squares.reverse()
+        return side, squares
+
+
+class Tablebases():
+    # Every table found in a directory, memory-mapped
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        self.maps = []
+        self.max_pieces = 2
+        if os.path.isdir(directory):
+            for filename in sorted(os.listdir(directory)):
+                if filename.endswith('.ntb'):
+                    self.load(os.path.join(directory, filename))
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(16)
+            if header[:8] != HEADER:
+                raise ValueError(f'Not a tablebase: {path}')
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        name = header[8:].rstrip(b'\0').decode()
+        table = Table(name, memoryview(data)[16:])
+        self.maps.append(data)
+        self.tables[name] = table
+        self.max_pieces = max(self.max_pieces, len(table.pieces))
+        return table
+
+    def close(self):
+        for table in self.tables.values():
+            table.values.release()
+        for data in self.maps:
+            data.close()
+
+    def probe_squares(self, pieces, squares, side):
+        # Raw table value for (color, kind) pieces on squares, or None
+        # without a table for the material
+        if len(pieces) == 2:
+            return DRAW
+        name, swapped_name = material_name(pieces)
+        table = self.tables.get(name)
+        if table is None:
+            table = self.tables.get(swapped_name)
+            if table is None:
+                return None
+            # Same position with the colors swapped and the board mirrored
+            pieces = [(color ^ 1, kind) for color, kind in pieces]
+            squares = [sq ^ 56 for sq in squares]
+            side ^= 1
+
+        # Put the pieces into the table's order
+        remaining = list(zip(pieces, squares))
+        ordered = []
+        for piece in table.pieces:
+            for i, (other, sq) in enumerate(remaining):
+                if other == piece:
+                    ordered.append(sq)
+                    del remaining[i]
+                    break
+        return table.value(side, ordered)
+
+    def probe_value(self, gamestate):
+        if gamestate.castling:
+            return None
+        occ = gamestate.occupancy[WHITE] | gamestate.occupancy[BLACK]
+        if bin(occ).count('1') > self.max_pieces:
+            return None
+        pieces = []
+        squares = []
+        for piece, bb in enumerate(gamestate.pieces):
+            if bb and piece % 6 == 0:
+                return None  # pawns are not covered
+            for sq in iter_bits(bb):
+                pieces.append(divmod(piece, 6))
+                squares.append(sq)
+        return self.probe_squares(pieces, squares, gamestate.side)
+
+    def probe(self, gamestate):
+        # (result, plies) for the side to move, result being 1, 0 or -1, or
+        # None when there is no table for the position
+        value = self.probe_value(gamestate)
+        if value is None or value == INVALID:
+            return None
+        if value == DRAW:
+            return 0, 0
+        plies = value - 1
+        return (1 if plies & 1 else -1), plies
+
+    def best_move(self, gamestate):
+        # The move keeping the best table result, quickest mate first and
+        # slowest mate last, or None without a table
+        if self.probe(gamestate) is None:
+            return None
+        best, best_key = None, None
+        for move in gamestate.legal_moves():
+            gamestate.make_move(move)
+            probed = self.probe(gamestate)
+            gamestate.unmake_move()
+            if probed is None:
+                return None
+            result, plies = probed
+            # Sort key from the mover's side: win soon > draw > lose late
+            key = (-result, -plies if result < 0 else plies)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+
+class Generator():
+    # Retrograde analysis of one pawnless table. Captures lead into smaller
+    # tables, which have to be generated first.
+    def __init__(self, name, tablebases):
+        self.table = Table(name)
+        self.tablebases = tablebases
+        self.pieces = self.table.pieces
+        self.kings = [self.pieces.index((WHITE, KING)), self.pieces.index((BLACK, KING))]
+
+    def attacked(self, target, by_color, squares, occ, skip=-1):
+        for i, (color, kind) in enumerate(self.pieces):
+            if color == by_color and i != skip and attacks_square(kind, squares[i], target, occ):
+                return True
+        return False
+
+    def is_valid(self, side, squares):
+        if len(set(squares)) != len(squares):
+            return False
+        kings = self.kings
+        if KING_ATTACKS[squares[kings[WHITE]]] & BIT[squares[kings[BLACK]]]:
+            return False
+        occ = 0
+        for sq in squares:
+            occ |= BIT[sq]
+        # The side that just moved cannot be in check
+        return not self.attacked(squares[kings[side ^ 1]], side, squares, occ)
+
+    def successors(self, side, squares):
+        # Legal moves as ('move', index) inside the table or ('capture', raw
+        # value of the smaller table)
+        pieces = self.pieces
+        occ = own = 0
+        for i, sq in enumerate(squares):
+            occ |= BIT[sq]
+            if pieces[i][0] == side:
+                own |= BIT[sq]
+        king = self.kings[side]
+        result = []
+        for i, (color, kind) in enumerate(pieces):
+            if color != side:
+                continue
+            for to in iter_bits(piece_attacks(kind, squares[i], occ) & ~own):
+                captured = -1
+                if occ & BIT[to]:
+                    captured = squares.index(to)
+                new_squares = list(squares)
+                new_squares[i] = to
+                new_occ = (occ ^ BIT[squares[i]]) | BIT[to]
+                if self.attacked(new_squares[king], side ^ 1, new_squares, new_occ, captured):
+                    continue
+                if captured < 0:
+                    result.append(('move', self.table.index(side ^ 1, new_squares)))
+                else:
+                    del new_squares[captured]
+                    rest = pieces[:captured] + pieces[captured + 1:]
+                    value = self.tablebases.probe_squares(rest, new_squares, side ^ 1)
+                    if value is None:
+                        raise ValueError(f'Generate the table for {material_name(rest)[0]} '
+                                         f'before {self.table.name}')
+                    result.append(('capture', value))
+        return result
+
+    def predecessors(self, side, squares):
+        # Canonical indexes of positions with a non-capture leading here
+        pieces = self.pieces
+        mover = side ^ 1
+        occ = 0
+        for sq in squares:
+            occ |= BIT[sq]
+        result = set()
+        for i, (color, kind) in enumerate(pieces):
+            if color != mover:
+                continue
+            for origin in iter_bits(piece_attacks(kind, squares[i], occ) & ~occ):
+                new_squares = list(squares)
+                new_squares[i] = origin
+                if self.is_valid(mover, new_squares):
+                    result.add(self.table.index(mover, new_squares))
+        return result
+
+    def positions(self):
+        # (index, side, squares) for every slot of the table
+        others = len(self.pieces) - 1
+        for side in (WHITE, BLACK):
+            index = side * self.table.size
+            for king in TRIANGLE:
+                for rest in itertools.product(range(64), repeat=others):
+                    yield index, side, (king,) + rest
+                    index += 1
+
+    def generate(self):
+        size = self.table.size
+        values = bytearray([INVALID]) * (2 * size)
+        counts = bytearray(2 * size)
+        escape = bytearray(2 * size)
+        floor = bytearray(2 * size)
+        buckets = [[] for _ in range(MAX_PLIES + 2)]
+
+        for index, side, squares in self.positions():
+            squares = list(squares)
+            if not self.is_valid(side, squares) or self.table.index(side, squares) != index:
+                continue
+            values[index] = DRAW
+            moves = self.successors(side, squares)
+            if not moves:
+                if self.attacked(squares[self.kings[side]], side ^ 1, squares,
+                                 sum(BIT[sq] for sq in squares)):
+                    buckets[0].append(index)
+                continue
+            targets = set()
+            for kind, value in moves:
+                if kind == 'move':
+                    targets.add(value)
+                elif value == DRAW or value == INVALID:
+                    escape[index] = 1
+                elif (value - 1) & 1:
+                    # Capturing into a position the opponent wins
+                    floor[index] = max(floor[index], value)
+                else:
+                    # Capturing into a won position, so this one is never lost
+                    escape[index] = 1
+                    buckets[value].append(index)
+            counts[index] = len(targets)
+            if not targets and not escape[index]:
+                buckets[floor[index]].append(index)
+
+        decided = bytearray(2 * size)
+        for plies in range(MAX_PLIES + 1):
+            for index in buckets[plies]:
+                if decided[index]:
+                    continue
+                decided[index] = 1
+                values[index] = plies + 1
+                side, squares = self.table.decode(index)
+                for parent in self.predecessors(side, squares):
+                    if decided[parent] or values[parent] == INVALID:
+                        continue
+                    if not plies & 1:
+                        buckets[plies + 1].append(parent)
+                    elif counts[parent]:
+                        counts[parent] -= 1
+                        if not counts[parent] and not escape[parent]:
+                            buckets[max(plies + 1, floor[parent])].append(parent)
+        self.table.values = values
+        return self.table
+
+
+def write_table(table, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = table_path(directory, table.name)
+    with open(path, 'wb') as f:
+        f.write(HEADER + table.name.encode().ljust(8, b'\0'))
+        f.write(table.values)
+    return path
+
+
+def dependencies(name):
+    # Tables a capture can lead into, smallest first
+    pieces = parse_name(name)
+    names = []
+    for i, (color, kind) in enumerate(pieces):
+        if kind == KING:
+            continue
+        rest = pieces[:i] + pieces[i + 1:]
+        if len(rest) > 2:
+            first, swapped = material_name(rest)
+            sub = first if first in THREE_PIECE + FOUR_PIECE else swapped
+            for dependency in dependencies(sub) + [sub]:
+                if dependency not in names:
+                    names.append(dependency)
+    return names
+
+
+def generate(names, directory):
+    tablebases = Tablebases(directory)
+    for name in names:
+        for needed in dependencies(name) + [name]:
+            if needed in tablebases.tables:
+                continue
+            start = time.perf_counter()
+            table = Generator(needed, tablebases).generate()
+            path = write_table(table, directory)
+            elapsed = time.perf_counter() - start
+            tablebases.load(path)
+            print(f'{needed}: {elapsed:.1f}s, {os.path.getsize(path)} bytes')
+    tablebases.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate pawnless endgame tablebases.')
+    parser.add_argument('tables', nargs='*', help='e.g. KQvK KRvK KQvKR, default all 3-piece')
+    parser.add_argument('--directory', default='tablebases')
+    args = parser.parse_args(argv)
+    generate(args.tables or THREE_PIECE, args.directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
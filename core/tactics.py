@@ -0,0 +1,94 @@
+import argparse
+import sys
+
+from core.bitboard import BitboardGameState, STARTING_FEN
+from core.engine import Engine, SELECTIVE
+from core.pgn import parse_san
+
+# Win At Chess 1 to 20, as (FEN, best move in SAN)
+TACTICS = (
+    ('2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - 0 1', 'Qg6'),
+    ('8/7p/5k2/5p2/p1p2P2/Pr1pPK2/1P1R3P/8 b - - 0 1', 'Rxb2'),
+    ('5rk1/1ppb3p/p1pb4/6q1/3P1p1r/2P1R2P/PP1BQ1P1/5RKN w - - 0 1', 'Rg3'),
+    ('r1bq2rk/pp3pbp/2p1p1pQ/7P/3P4/2PB1N2/PP3PPR/2KR4 w - - 0 1', 'Qxh7+'),
+    ('5k2/6pp/p1qN4/1p1p4/3P4/2PKP2Q/PP3r2/3R4 b - - 0 1', 'Qc4+'),
+    ('7k/p7/1R5K/6r1/6p1/6P1/8/8 w - - 0 1', 'Rb7'),
+    ('rnbqkb1r/pppp1ppp/8/4P3/6n1/7P/PPPNPPP1/R1BQKBNR b KQkq - 0 1', 'Ne3'),
+    ('r4q1k/p2bR1rp/2p2Q1N/5p2/5p2/2P5/PP3PPP/R5K1 w - - 0 1', 'Rf7'),
+    ('3q1rk1/p4pp1/2pb3p/3p4/6Pr/1PNQ4/P1PB1PP1/4RRK1 b - - 0 1', 'Bh2+'),
+    ('2br2k1/2q3rn/p2NppQ1/2p1P3/Pp5R/4P3/1P3PPP/3R2K1 w - - 0 1', 'Rxh7'),
+    ('r1b1kb1r/3q1ppp/pBp1pn2/8/Np3P2/5B2/PPP3PP/R2Q1RK1 w kq - 0 1', 'Bxc6'),
+    ('4k1r1/2p3r1/1pR1p3/3pP2p/3P2qP/P4N2/1PQ4P/5R1K b - - 0 1', 'Qxf3+'),
+    ('5rk1/pp4p1/2n1p2p/2Npq3/2p5/6P1/P3P1BP/R4Q1K w - - 0 1', 'Qxf8+'),
+    ('r2rb1k1/pp1q1p1p/2n1p1p1/2bp4/5P2/PP1BPR1Q/1BPN2PP/R5K1 w - - 0 1', 'Qxh7+'),
+    ('1R6/1brk2p1/4p2p/p1P1Pp2/P7/6P1/1P4P1/2R3K1 w - - 0 1', 'Rxb7'),
+    ('r4rk1/ppp2ppp/2n5/2bqp3/8/P2PB3/1PP1NPPP/R2Q1RK1 w - - 0 1', 'Nc3'),
+    ('1k5r/pppbn1pp/4q1r1/1P3p2/2NPp3/1QP5/P4PPP/R1B1R1K1 w - - 0 1', 'Ne5'),
+    ('R7/P4k2/8/8/8/8/r7/6K1 w - - 0 1', 'Rh8'),
+    ('r1b2rk1/ppbn1ppp/4p3/1QP4q/3P4/N4N2/5PPP/R1B2RK1 w - - 0 1', 'c6'),
+    ('r2qkb1r/1ppb1ppp/p7/4p3/P1Q1P3/2P5/5PPP/R1B2KNR b kq - 0 1', 'Bb5'),
+)
+
+# Quiet positions for the depth reached in a fixed time: the start, an
+# open middlegame (Kiwipete) and a closed one
+DEPTH_POSITIONS = (
+    STARTING_FEN,
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r1bq1rk1/pp2nppp/2n1p3/3pP3/2pP4/P1P2N2/2P1BPPP/R1BQK2R w KQ - 0 1',
+)
+
+
+def configurations():
+    # (name, techniques): none, each alone, all, and all but each
+    configs = [('none', ())]
+    configs += [(technique, (technique,)) for technique in SELECTIVE]
+    configs.append(('all', SELECTIVE))
+    configs += [(f'all but {technique}', tuple(t for t in SELECTIVE if t != technique))
+                for technique in SELECTIVE]
+    return configs
+
+
+def solve_rate(selective, time_limit, positions=TACTICS):
+    # Positions where the engine plays the best move within time_limit
+    solved = 0
+    for fen, san in positions:
+        gamestate = BitboardGameState.from_fen(fen)
+        engine = Engine(time_limit=time_limit, selective=selective)
+        if engine.search(gamestate) == parse_san(gamestate, san):
+            solved += 1
+    return solved
+
+
+def mean_depth(selective, time_limit, fens=DEPTH_POSITIONS):
+    # Mean depth of the last completed iteration, and nodes per second
+    depths = nodes = seconds = 0
+    for fen in fens:
+        engine = Engine(time_limit=time_limit, selective=selective)
+        engine.search(BitboardGameState.from_fen(fen))
+        depths += engine.info.depth
+        nodes += engine.info.nodes
+        seconds += engine.info.time
+    return depths / len(fens), nodes / seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare selective search techniques on depth and a tactical suite.')
+    parser.add_argument('--time', type=float, default=1.0, help='seconds per tactic')
+    parser.add_argument('--depth-time', type=float, default=5.0,
+                        help='seconds per position for the depth comparison')
+    parser.add_argument('--only', nargs='*', help='configurations to run, by name')
+    args = parser.parse_args(argv)
+
+    print(f'{"configuration":28} {"depth":>6} {"nodes/s":>8} {"solved":>7}')
+    for name, selective in configurations():
+        if args.only and name not in args.only:
+            continue
+        depth, nps = mean_depth(selective, args.depth_time)
+        solved = solve_rate(selective, args.time)
+        print(f'{name:28} {depth:6.2f} {nps:8.0f} {solved:>4}/{len(TACTICS)}', flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy as np
+
+from core.bitboard import BitboardGameState, STARTING_FEN, CAPTURE, PROMOTION, move_to_uci, \
+    parse_uci_move
+from core.engine import Engine, MATE, MAX_PLY
+from core.evaluation import evaluate_with_pawns
+from core.match import adjudicate
+from core.nnue import INPUTS, HIDDEN, HIDDEN2, WDL_SCALE, FEATURES, Network, save_network
+from core.pawns import PawnTable
+
+# Self-play games start with this many random moves, so the engine does
+# not play the same few games over and over
+RANDOM_PLIES = 8
+# Positions before this ply are left out, as are positions in check and
+# right after a capture or promotion, whose static scores are unreliable
+MIN_PLY = 8
+# Target = LAMBDA * expected score from the label + (1 - LAMBDA) * result
+LAMBDA = 0.5
+
+
+def play_selfplay_game(task):
+    # A game in the record format of core.match, so its output files can
+    # be used for training as well
+    game, seed, nodes = task
+    rng = random.Random(seed)
+    engine = Engine(time_limit=float('inf'), node_limit=nodes)
+    gamestate = BitboardGameState()
+    moves = []
+    while True:
+        outcome = adjudicate(gamestate)
+        if outcome is not None:
+            break
+        if len(moves) < RANDOM_PLIES:
+            move = rng.choice(gamestate.legal_moves())
+        else:
+            move = engine.search(gamestate)
+        moves.append(move_to_uci(move))
+        gamestate.make_move(move)
+    result, reason = outcome
+    return {'game': game, 'opening': STARTING_FEN, 'result': result, 'reason': reason,
+            'moves': moves}
+
+
+def selfplay(games, nodes, processes=None, seed=0):
+    tasks = [(game, seed * 1000003 + game, nodes) for game in range(games)]
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+        yield from pool.imap_unordered(play_selfplay_game, tasks)
+
+
+def features(gamestate):
+    # Active inputs of the side to move and of the other side
+    side = gamestate.side
+    own, other = FEATURES[side], FEATURES[side ^ 1]
+    indexes = [piece * 64 + sq for sq, piece in enumerate(gamestate.squares)
+               if piece is not None]
+    return [own[i] for i in indexes], [other[i] for i in indexes]
+
+
+def label(gamestate, engine, pawn_table):
+    # Centipawns for the side to move: static evaluation, or a search
+    # when an engine is given
+    if engine is None:
+        return evaluate_with_pawns(gamestate, pawn_table)
+    engine.search(gamestate)
+    score = engine.info.score
+    if abs(score) >= MATE - MAX_PLY:
+        return 2000 if score > 0 else -2000
+    return score
+
+
+def positions(records, label_nodes=0, min_ply=MIN_PLY):
+    # (own inputs, other inputs, target) for the quiet positions of games
+    engine = Engine(time_limit=float('inf'), node_limit=label_nodes) if label_nodes else None
+    # Kept for the whole run, games share most of their pawn structures
+    pawn_table = PawnTable()
+    for record in records:
+        white_score = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}.get(record['result'])
+        if white_score is None:
+            continue
+        gamestate = BitboardGameState.from_fen(record['opening'])
+        for ply, uci in enumerate(record['moves']):
+            move = parse_uci_move(gamestate, uci)
+            gamestate.make_move(move)
+            if ply + 1 < min_ply or move >> 12 & (CAPTURE | PROMOTION) or gamestate.in_check():
+                continue
+            result = white_score if gamestate.side == 0 else 1 - white_score
+            expected = 1 / (1 + np.exp(-label(gamestate, engine, pawn_table) / WDL_SCALE))
+            own, other = features(gamestate)
+            yield own, other, LAMBDA * expected + (1 - LAMBDA) * result
+
+
+def dense(rows):
+    matrix = np.zeros((len(rows), INPUTS), np.float32)
+    for i, row in enumerate(rows):
+        matrix[i, row] = 1
+    return matrix
+
+
+class Trainer():
+    # The float network that Network quantizes, trained with Adam on the
+    # squared error between sigmoid(output) and the target
+    def __init__(self, hidden=HIDDEN, hidden2=HIDDEN2, lr=1e-3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.params = [
+            rng.normal(0, 0.05, (INPUTS, hidden)).astype(np.float32),
+            np.full(hidden, 0.1, np.float32),
+            rng.normal(0, np.sqrt(1 / hidden), (2 * hidden, hidden2)).astype(np.float32),
+            np.zeros(hidden2, np.float32),
+            rng.normal(0, np.sqrt(1 / hidden2), hidden2).astype(np.float32),
+            np.zeros(1, np.float32),
+        ]
+        self.lr = lr
+        self.moments = [(np.zeros_like(p), np.zeros_like(p)) for p in self.params]
+        self.steps = 0
+
+    def forward(self, own, other):
+        w1, b1, w2, b2, w3, b3 = self.params
+        z_own, z_other = own @ w1 + b1, other @ w1 + b1
+        a = np.concatenate([np.clip(z_own, 0, 1), np.clip(z_other, 0, 1)], axis=1)
+        z2 = a @ w2 + b2
+        h = np.clip(z2, 0, 1)
+        return h @ w3 + b3[0], (z_own, z_other, a, z2, h)
+
+    def loss(self, own, other, target):
+        output, _ = self.forward(own, other)
+        return float(np.mean((1 / (1 + np.exp(-output)) - target) ** 2))
+
+    def step(self, own, other, target):
+        w1, b1, w2, b2, w3, b3 = self.params
+        output, (z_own, z_other, a, z2, h) = self.forward(own, other)
+        p = 1 / (1 + np.exp(-output))
+        d_output = 2 * (p - target) * p * (1 - p) / len(target)
+        d_z2 = np.outer(d_output, w3) * ((z2 > 0) & (z2 < 1))
+        d_a = d_z2 @ w2.T
+        hidden = w1.shape[1]
+        d_own = d_a[:, :hidden] * ((z_own > 0) & (z_own < 1))
+        d_other = d_a[:, hidden:] * ((z_other > 0) & (z_other < 1))
+        grads = [own.T @ d_own + other.T @ d_other, d_own.sum(0) + d_other.sum(0),
+                 a.T @ d_z2, d_z2.sum(0), h.T @ d_output, np.array([d_output.sum()])]
+
+        self.steps += 1
+        beta1, beta2 = 0.9, 0.999
+        for param, grad, (m, v) in zip(self.params, grads, self.moments):
+            m *= beta1
+            m += (1 - beta1) * grad
+            v *= beta2
+            v += (1 - beta2) * grad * grad
+            m_hat = m / (1 - beta1 ** self.steps)
+            v_hat = v / (1 - beta2 ** self.steps)
+            param -= self.lr * m_hat / (np.sqrt(v_hat) + 1e-8)
+        return float(np.mean((p - target) ** 2))
+
+    def network(self):
+        w1, b1, w2, b2, w3, b3 = self.params
+        return Network.from_float(w1, b1, w2, b2, w3, b3[0])
+
+
+def quantization_error(trainer, network, own, other):
+    # Mean difference in centipawns between the float and int16 networks
+    output, _ = trainer.forward(own, other)
+    w1 = network.w1.astype(np.int64)
+    differences = []
+    for i in range(len(own)):
+        values = np.stack([network.b1 + own[i].astype(bool) @ w1,
+                           network.b1 + other[i].astype(bool) @ w1])
+        differences.append(abs(network.evaluate(values, 0) - output[i] * WDL_SCALE))
+    return float(np.mean(differences))
+
+
+def read_records(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Train a core.nnue network on self-play games.')
+    parser.add_argument('games', nargs='*',
+                        help='JSON lines game files, as written by core.match or --save-games')
+    parser.add_argument('--selfplay', type=int, default=0, help='play this many games first')
+    parser.add_argument('--selfplay-nodes', type=int, default=300,
+                        help='search nodes per self-play move')
+    parser.add_argument('--save-games', help='append the self-play games to this file')
+    parser.add_argument('--processes', type=int, help='self-play processes, default one per core')
+    parser.add_argument('--label-nodes', type=int, default=0,
+                        help='label positions with a search of this many nodes instead of '
+                             'the static evaluation')
+    parser.add_argument('--output', default='nnue.bin', help='weights file')
+    parser.add_argument('--hidden', type=int, default=HIDDEN)
+    parser.add_argument('--hidden2', type=int, default=HIDDEN2)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch', type=int, default=256)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    records = list(read_records(args.games))
+    if args.selfplay:
+        start = time.perf_counter()
+        sink = open(args.save_games, 'a') if args.save_games else None
+        try:
+            for record in selfplay(args.selfplay, args.selfplay_nodes, args.processes, args.seed):
+                records.append(record)
+                if sink:
+                    sink.write(json.dumps(record) + '\n')
+        finally:
+            if sink:
+                sink.close()
+        print(f'{args.selfplay} self-play games in {time.perf_counter() - start:.0f}s')
+    if not records:
+        parser.error('no games: give game files or --selfplay')
+
+    # Every tenth game is held out. Positions of one game share its result,
+    # so holding out single positions would flatter the validation loss.
+    def matrices(games):
+        data = list(positions(games, args.label_nodes))
+        return ([row[0] for row in data], [row[1] for row in data],
+                np.array([row[2] for row in data], np.float32))
+
+    own, other, target = matrices(records[i] for i in range(len(records)) if i % 10)
+    val_own, val_other, val_target = matrices(records[::10])
+    val_own, val_other = dense(val_own), dense(val_other)
+    training = np.arange(len(target))
+    rng = np.random.default_rng(args.seed)
+    print(f'{len(records)} games, {len(target)} training and {len(val_target)} '
+          f'validation positions')
+
+    trainer = Trainer(args.hidden, args.hidden2, args.lr, args.seed)
+    for epoch in range(args.epochs):
+        start = time.perf_counter()
+        rng.shuffle(training)
+        losses = []
+        for at in range(0, len(training), args.batch):
+            batch = training[at:at + args.batch]
+            losses.append(trainer.step(dense([own[i] for i in batch]),
+                                       dense([other[i] for i in batch]), target[batch]))
+        print(f'epoch {epoch + 1}: training loss {np.mean(losses):.5f}, validation loss '
+              f'{trainer.loss(val_own, val_other, val_target):.5f} '
+              f'({time.perf_counter() - start:.1f}s)', flush=True)
+
+    network = trainer.network()
+    save_network(network, args.output)
+    error = quantization_error(trainer, network, val_own[:1000], val_other[:1000])
+    print(f'saved {args.output}, int16 network within {error:.1f}cp of the float one on average')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
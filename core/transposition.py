@@ -0,0 +1,136 @@
+from array import array
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+# Each entry is two 64-bit words: the Zobrist key XORed with the packed data
+# below, and the data itself. A torn write from another process sharing the
+# table then fails the key check instead of handing back a wrong entry.
+ENTRY_BYTES = 16
+ENTRIES_PER_BUCKET = 2  # slot 0 is depth-preferred, slot 1 always-replace
+
+# Data word layout
+MOVE_BITS = 16
+DEPTH_SHIFT = 16
+BOUND_SHIFT = 24
+SCORE_SHIFT = 26
+AGE_SHIFT = 58
+SCORE_OFFSET = 1 << 31
+AGE_MASK = 63
+
+
+def table_bytes(size_mb):
+    return max(1, (size_mb << 20) // (ENTRY_BYTES * ENTRIES_PER_BUCKET)) \
+        * ENTRY_BYTES * ENTRIES_PER_BUCKET
+
+
+class TranspositionTable():
+    # With a buffer (e.g. multiprocessing shared memory of table_bytes()
+    # bytes) the entries live there and several processes can share them.
+    def __init__(self, size_mb=16, buffer=None):
+        self.buffer = buffer
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        self.n_buckets = table_bytes(size_mb) // (ENTRY_BYTES * ENTRIES_PER_BUCKET)
+        if self.buffer is None:
+            self.clear()
+            return
+        # A shared buffer is not cleared, other processes may already be
+        # using it
+        n_entries = self.n_buckets * ENTRIES_PER_BUCKET
+        view = memoryview(self.buffer)
+        self.keys = view[:8 * n_entries].cast('Q')
+        self.data = view[8 * n_entries:16 * n_entries].cast('Q')
+        self.age = 0
+        self.reset_counters()
+
+    def clear(self):
+        n_entries = self.n_buckets * ENTRIES_PER_BUCKET
+        if self.buffer is None:
+            self.keys = array('Q', bytes(8 * n_entries))
+            self.data = array('Q', bytes(8 * n_entries))
+        else:
+            memoryview(self.buffer)[:16 * n_entries] = bytes(16 * n_entries)
+        self.age = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def new_search(self):
+        # Entries from older searches lose their claim on the depth slot
+        self.age = (self.age + 1) & AGE_MASK
+
+    @property
+    def memory_bytes(self):
+        return self.keys.itemsize * len(self.keys) + self.data.itemsize * len(self.data)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def usage(self):
+        # Share of filled slots, sampled from the first 1000 like UCI hashfull
+        sample = self.data[:1000]
+        return sum(1 for data in sample if data) / len(sample)
+
+    def probe(self, key):
+        # Returns (depth, bound, score, move) or None
+        self.probes += 1
+        index = (key % self.n_buckets) * ENTRIES_PER_BUCKET
+        for slot in (index, index + 1):
+            data = self.data[slot]
+            if self.keys[slot] ^ data == key:
+                self.hits += 1
+                return ((data >> DEPTH_SHIFT) & 0xFF,
+                        (data >> BOUND_SHIFT) & 3,
+                        ((data >> SCORE_SHIFT) & 0xFFFFFFFF) - SCORE_OFFSET,
+                        data & 0xFFFF)
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        self.stores += 1
+        index = (key % self.n_buckets) * ENTRIES_PER_BUCKET
+        keys = self.keys
+        data = self.data
+
+        if keys[index + 1] ^ data[index + 1] == key:
+            slot = index + 1
+        else:
+            old = data[index]
+            old_key = keys[index] ^ old
+            # The depth-preferred slot takes the entry if it is for the same
+            # position, at least as deep, or left over from an older search
+            if old_key == key or not old_key \
+                    or depth >= (old >> DEPTH_SHIFT) & 0xFF \
+                    or (old >> AGE_SHIFT) != self.age:
+                slot = index
+            else:
+                slot = index + 1
+
+        old = data[slot]
+        old_key = keys[slot] ^ old
+        if old_key == key and not move:
+            # Keep the best move of a shallower search of the same position
+            move = old & 0xFFFF
+        elif old_key and old_key != key:
+            self.overwrites += 1
+
+        new = (move | (depth << DEPTH_SHIFT) | (bound << BOUND_SHIFT)
+               | ((score + SCORE_OFFSET) << SCORE_SHIFT) | (self.age << AGE_SHIFT))
+        keys[slot] = key ^ new
+        data[slot] = new
+
+    def stats(self):
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hit_rate,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'usage': self.usage(),
+            'memory_bytes': self.memory_bytes,
+        }
@@ -0,0 +1,286 @@
+import argparse
+import multiprocessing
+import sys
+import threading
+
+from core.bitboard import BitboardGameState, STARTING_FEN, move_to_uci, parse_uci_move
+from core.engine import Engine, MATE, MAX_PLY
+
+NAME = 'NinjaChess'
+AUTHOR = 'NinjaChess developers'
+
+# (name, type, default, min, max) of the options sent in reply to uci
+OPTIONS = (
+    ('Hash', 'spin', 16, 1, 4096),
+    ('Threads', 'spin', 1, 1, multiprocessing.cpu_count()),
+    ('Ponder', 'check', False, None, None),
+    ('Move Overhead', 'spin', 50, 0, 5000),
+)
+
+# Moves the rest of the game is assumed to last when the GUI does not say
+MOVES_TO_GO = 40
+# Time of an iteration over the time of the previous one, a typical
+# value: it ranges from 2 to 10 between middlegame iterations
+ITERATION_GROWTH = 5
+
+
+def allocate_time(remaining, increment=0, moves_to_go=None, overhead=50):
+    # (soft, hard) limits in seconds for one move, from the clock in ms.
+    # The hard limit aborts the search. The soft limit only stops a new
+    # iteration from starting. An iteration takes about ITERATION_GROWTH
+    # times as long as the one before, so one started before the soft limit
+    # usually finishes before the hard one.
+    # overhead is kept back for the GUI and the pipe, so the engine does
+    # not lose on time when the machine is busy.
+    moves_to_go = min(moves_to_go or MOVES_TO_GO, MOVES_TO_GO)
+    usable = max(remaining - overhead, 0)
+    target = usable / moves_to_go + increment * 0.75
+    hard = min(target * 2, usable * 0.5)
+    soft = hard / ITERATION_GROWTH
+    return soft / 1000, hard / 1000
+
+
+def format_score(score):
+    if score >= MATE - MAX_PLY:
+        return f'mate {(MATE - score + 1) // 2}'
+    if score <= -MATE + MAX_PLY:
+        return f'mate {-((MATE + score) // 2)}'
+    return f'cp {score}'
+
+
+def info_line(info):
+    line = (f'info depth {info.depth} score {format_score(info.score)} nodes {info.nodes} '
+            f'nps {info.nps:.0f} time {info.time * 1000:.0f}')
+    if info.tb_hits:
+        line += f' tbhits {info.tb_hits}'
+    if info.pv:
+        line += ' pv ' + ' '.join(move_to_uci(move) for move in info.pv)
+    return line
+
+
+class UciSearch():
+    # Stop and ponderhit come from the thread reading stdin, and every
+    # completed iteration is streamed as an info line
+    def stop_requested(self):
+        return self.uci.stop_event.is_set()
+
+    def ponderhit_received(self):
+        return self.uci.ponderhit_event.is_set()
+
+    def report(self, info):
+        self.uci.send(info_line(info))
+
+
+class UciEngine(UciSearch, Engine):
+    pass
+
+
+def parallel_engine(threads, hash_mb):
+    # Imported here so a single threaded engine never starts the helpers'
+    # multiprocessing machinery
+    from core.smp import ParallelEngine
+
+    class UciParallelEngine(UciSearch, ParallelEngine):
+        pass
+
+    return UciParallelEngine(threads, hash_mb=hash_mb)
+
+
+class Uci():
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.options = {name: default for name, _, default, _, _ in OPTIONS}
+        self.engine = None
+        self.gamestate = BitboardGameState()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.ponderhit_event = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def get_engine(self):
+        # Built on first use and again after Hash or Threads change
+        if self.engine is None:
+            threads, hash_mb = self.options['Threads'], self.options['Hash']
+            if threads > 1:
+                self.engine = parallel_engine(threads, hash_mb)
+            else:
+                self.engine = UciEngine(hash_mb=hash_mb)
+            self.engine.uci = self
+        return self.engine
+
+    def close_engine(self):
+        if self.engine is not None and hasattr(self.engine, 'close'):
+            self.engine.close()
+        self.engine = None
+
+    def handle(self, line):
+        # False once the GUI sends quit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f'id name {NAME}')
+            self.send(f'id author {AUTHOR}')
+            for name, kind, default, low, high in OPTIONS:
+                if kind == 'check':
+                    self.send(f'option name {name} type check default {str(default).lower()}')
+                else:
+                    self.send(f'option name {name} type spin default {default} '
+                              f'min {low} max {high}')
+            self.send('uciok')
+        elif command == 'isready':
+            self.get_engine()
+            self.send('readyok')
+        elif command == 'setoption':
+            self.stop_search()
+            self.set_option(args)
+        elif command == 'ucinewgame':
+            self.stop_search()
+            if self.engine is not None:
+                self.engine.tt.clear()
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self.go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            self.ponderhit_event.set()
+        elif command == 'quit':
+            self.stop_search()
+            self.close_engine()
+            return False
+        else:
+            self.send(f'info string unknown command {command}')
+        return True
+
+    def set_option(self, args):
+        # setoption name <name with spaces> value <value>
+        if 'name' not in args:
+            return
+        name_at = args.index('name') + 1
+        if 'value' in args:
+            value_at = args.index('value')
+            name, value = ' '.join(args[name_at:value_at]), ' '.join(args[value_at + 1:])
+        else:
+            name, value = ' '.join(args[name_at:]), None
+        for option, kind, _, low, high in OPTIONS:
+            if option.lower() != name.lower():
+                continue
+            if kind == 'check':
+                self.options[option] = value == 'true'
+            else:
+                try:
+                    self.options[option] = max(low, min(high, int(value)))
+                except (TypeError, ValueError):
+                    self.send(f'info string invalid value for {option}: {value}')
+                    return
+            if option in ('Hash', 'Threads'):
+                self.close_engine()
+            return
+        self.send(f'info string unknown option {name}')
+
+    def set_position(self, args):
+        # position [startpos | fen <fen>] [moves <move> ...]
+        moves_at = args.index('moves') if 'moves' in args else len(args)
+        if args and args[0] == 'fen':
+            fen = ' '.join(args[1:moves_at])
+        else:
+            fen = STARTING_FEN
+        try:
+            gamestate = BitboardGameState.from_fen(fen)
+            for uci in args[moves_at + 1:]:
+                gamestate.make_move(parse_uci_move(gamestate, uci))
+        except (ValueError, IndexError, KeyError) as error:
+            self.send(f'info string invalid position: {error}')
+            return
+        self.gamestate = gamestate
+
+    def go(self, args):
+        params = {}
+        flags = set()
+        index = 0
+        while index < len(args):
+            token = args[index]
+            if token in ('infinite', 'ponder'):
+                flags.add(token)
+            elif token == 'searchmoves':
+                # Not supported, skip the moves
+                while index + 1 < len(args) and args[index + 1][0] in 'abcdefgh':
+                    index += 1
+            elif index + 1 < len(args):
+                try:
+                    params[token] = int(args[index + 1])
+                except ValueError:
+                    pass
+                index += 1
+            index += 1
+
+        engine = self.get_engine()
+        engine.time_limit = float('inf')
+        engine.soft_time_limit = None
+        engine.node_limit = params.get('nodes')
+        engine.max_depth = max(1, min(params.get('depth', MAX_PLY - 1), MAX_PLY - 1))
+        white = self.gamestate.side == 0
+        remaining = params.get('wtime' if white else 'btime')
+        if 'movetime' in params:
+            engine.time_limit = max(params['movetime'] - self.options['Move Overhead'], 1) / 1000
+        elif remaining is not None and 'infinite' not in flags:
+            engine.soft_time_limit, engine.time_limit = allocate_time(
+                remaining, params.get('winc' if white else 'binc', 0), params.get('movestogo'),
+                self.options['Move Overhead'])
+
+        self.stop_event.clear()
+        self.ponderhit_event.clear()
+        self.thread = threading.Thread(target=self.search, args=(engine, 'ponder' in flags,
+                                                                'infinite' in flags))
+        self.thread.start()
+
+    def search(self, engine, ponder, infinite):
+        move = engine.search(self.gamestate, ponder)
+        # In ponder and infinite mode bestmove waits for the GUI, even if the
+        # search is already done
+        while (infinite or ponder and not self.ponderhit_event.is_set()) \
+                and not self.stop_event.is_set():
+            self.stop_event.wait(0.01)
+        info = engine.info
+        self.send(info_line(info))
+        if move is None:
+            self.send('bestmove 0000')
+        elif len(info.pv) > 1 and info.pv[0] == move:
+            self.send(f'bestmove {move_to_uci(move)} ponder {move_to_uci(info.pv[1])}')
+        else:
+            self.send(f'bestmove {move_to_uci(move)}')
+
+    def stop_search(self):
+        # GUIs send stop before anything that changes the search, but a
+        # search left running would block the next one forever
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the engine under the UCI protocol on stdin and stdout.')
+    parser.parse_args(argv)
+    uci = Uci()
+    for line in sys.stdin:
+        if not uci.handle(line):
+            break
+    else:
+        uci.handle('quit')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+def opposite_color(color):
+    if color == 'b':
+        return 'w'
+    elif color == 'w':
+        return 'b'
+    raise ValueError('Something is up with the colors.')
+
+
+def _targets(x, y, offsets):
+    return [(x + dx, y + dy) for dx, dy in offsets if 0 <= x + dx < 8 and 0 <= y + dy < 8]
+
+
+def _rays(x, y, directions):
+    rays = []
+    for dx, dy in directions:
+        ray = []
+        x_, y_ = x + dx, y + dy
+        while 0 <= x_ < 8 and 0 <= y_ < 8:
+            ray.append((x_, y_))
+            x_, y_ = x_ + dx, y_ + dy
+        rays.append(ray)
+    return rays
+
+
+KNIGHT_OFFSETS = [(1, 2), (-1, 2), (-1, -2), (1, -2), (2, 1), (-2, 1), (-2, -1), (2, -1)]
+KING_OFFSETS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+# Lookup tables indexed [y][x], like GameState.position
+KNIGHT_TARGETS = [[_targets(x, y, KNIGHT_OFFSETS) for x in range(8)] for y in range(8)]
+KING_TARGETS = [[_targets(x, y, KING_OFFSETS) for x in range(8)] for y in range(8)]
+ROOK_RAYS = [[_rays(x, y, [(1, 0), (-1, 0), (0, 1), (0, -1)]) for x in range(8)]
+             for y in range(8)]
+BISHOP_RAYS = [[_rays(x, y, [(1, 1), (-1, 1), (1, -1), (-1, -1)]) for x in range(8)]
+               for y in range(8)]
+
+
+def detect_if_in_check(gamestate, color):
+    return gamestate.is_in_check(color)
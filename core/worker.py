@@ -0,0 +1,100 @@
+import multiprocessing
+import pickle
+import queue
+
+from core.engine import Engine
+
+
+class WorkerEngine(Engine):
+    # Engine running inside the worker process. Stop and ponderhit arrive
+    # as the id of the latest request they apply to, so a signal meant for
+    # one search never leaks into the next.
+    def __init__(self, stop_id, ponderhit_id, **kwargs):
+        super().__init__(**kwargs)
+        self.stop_id = stop_id
+        self.ponderhit_id = ponderhit_id
+        self.request_id = 0
+
+    def stop_requested(self):
+        return self.stop_id.value >= self.request_id
+
+    def ponderhit_received(self):
+        return self.ponderhit_id.value >= self.request_id
+
+
+def _serve(requests, results, stop_id, ponderhit_id, engine_options):
+    engine = WorkerEngine(stop_id, ponderhit_id, **engine_options)
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        request_id, data, ponder = request
+        engine.request_id = request_id
+        move = engine.search(pickle.loads(data), ponder)
+        results.put((request_id, move, engine.info, engine.tt.hit_rate))
+
+
+class EngineWorker():
+    # Runs the engine in a separate process so the caller never blocks on
+    # a search. start_search() returns straight away and poll() picks up
+    # the result once it is there.
+    def __init__(self, time_limit=1.0, hash_mb=16, book=None, tablebases=None):
+        context = multiprocessing.get_context('spawn')
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.stop_id = context.Value('q', 0, lock=False)
+        self.ponderhit_id = context.Value('q', 0, lock=False)
+        self.request_id = 0
+        self.result = None
+        self.pondering = False
+        self.process = context.Process(
+            target=_serve, daemon=True,
+            args=(self.requests, self.results, self.stop_id, self.ponderhit_id,
+                  {'time_limit': time_limit, 'hash_mb': hash_mb, 'book': book,
+                   'tablebases': tablebases}))
+        self.process.start()
+
+    def start_search(self, gamestate, ponder=False):
+        # Anything still running is stale now
+        self.stop()
+        self.request_id += 1
+        self.result = None
+        self.pondering = ponder
+        # Pickled here so the caller can keep changing the position
+        self.requests.put((self.request_id, pickle.dumps(gamestate), ponder))
+        return self.request_id
+
+    def poll(self):
+        # (move, info, tt hit rate) of the current request, or None while it
+        # is still searching. Results of superseded requests are dropped.
+        while self.result is None:
+            try:
+                request_id, *result = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if request_id == self.request_id:
+                self.result = tuple(result)
+        return self.result
+
+    def wait(self, timeout=None):
+        while self.result is None:
+            request_id, *result = self.results.get(timeout=timeout)
+            if request_id == self.request_id:
+                self.result = tuple(result)
+        return self.result
+
+    def stop(self):
+        self.stop_id.value = self.request_id
+
+    def ponderhit(self):
+        # The expected move was played: the ponder search becomes a normal
+        # timed search
+        self.pondering = False
+        self.ponderhit_id.value = self.request_id
+
+    def close(self):
+        self.stop()
+        self.requests.put(None)
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
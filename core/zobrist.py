@@ -0,0 +1,27 @@
+import random
+
+# Fixed seed so keys, and anything stored by them (books, tables), are the
+# same in every process.
+_random = random.Random(0x5EED)
+
+
+def _key():
+    return _random.getrandbits(64)
+
+
+# PIECE_KEYS[color * 6 + kind][square], using the bitboard piece order
+PIECE_KEYS = [[_key() for _ in range(64)] for _ in range(12)]
+SIDE_KEY = _key()
+CASTLING_KEYS = [_key() for _ in range(16)]
+EP_FILE_KEYS = [_key() for _ in range(8)]
+# Same keys for pawns and zero for the other pieces, so XORing in every
+# piece that comes and goes keeps a key of the pawns alone
+PAWN_KEYS = [PIECE_KEYS[piece] if piece % 6 == 0 else [0] * 64 for piece in range(12)]
+
+PIECE_ORDER = ('p', 'N', 'B', 'R', 'Q', 'K')
+
+
+def piece_key(piece, x, y):
+    # Key for one of the pieces.py objects standing on (x, y)
+    index = PIECE_ORDER.index(piece.char) + (0 if piece.color == 'w' else 6)
+    return PIECE_KEYS[index][y * 8 + x]
@@ -1,16 +1,22 @@
 import pygame
+import logging
 import math
-import numpy as np
-import time
+import os
 
-from pieces import *
-from board import GameState, Board
-from utils import highlight_coordinates, detect_if_in_check, opposite_color
-
-import random
+from board import Board
+from core.bitboard import BitboardGameState, move_to_positions
+from core.utils import detect_if_in_check
+from core.worker import EngineWorker
 
 GAMESIZE = 480
 PIECE_OFFSET = GAMESIZE/8
+ENGINE_TIME_LIMIT = 1.0  # seconds per engine move
+MAX_FPS = 60
+BOOK_PATH = 'book.bin'  # used when present, see python -m core.book
+TABLEBASE_PATH = 'tablebases'  # see python -m core.tablebase
+LOG_LEVEL = logging.INFO  # logging.DEBUG adds the engine's search stats
+
+log = logging.getLogger(__name__)
 
 
 x_to_rank = {0: "a", 1: "b", 2: "c", 3: "d", 4: "e", 5: "f", 6: "g", 7: "h"}
@@ -25,7 +31,7 @@ def translate_move(pos_from, pos_to):
         rank=x_to_rank[pos_to[0]], row=y_to_row[pos_to[1]])
 
     translation = f"{from_move_translation} -> {to_move_translation}"
-    print(translation)
+    log.info('%s', translation)
     return translation
 
 
@@ -33,63 +39,89 @@ def pos_to_index(pos):
     return (math.floor(pos[0] / PIECE_OFFSET), math.floor(pos[1] / PIECE_OFFSET))
 
 
-def evaluate(gamestate):
-    eval = 0
-    for row in gamestate.position:
-        for piece in row:
-            if piece is not None:
-                if piece.color == 'w':
-                    eval -= piece.value
-                else:
-                    eval += piece.value
-    return eval
-
-
-class Opponent():
-    def find_move(self, gamestate):
-        best_moves = []
-        best_eval = 0
-        for y, row in enumerate(gamestate.position):
-            for x, piece in enumerate(row):
-                pos_from = (x, y)
-                if piece is not None and piece.color == 'b':
-                    valid_moves = piece.get_valid_moves(pos_from, gamestate)
-                    for pos_to in valid_moves:
-                        gamestate.move(pos_from, pos_to)
-                        cur_eval = evaluate(gamestate)
-                        # Current move is as good as best found
-                        if cur_eval == best_eval:
-                            best_moves.append((pos_from, pos_to))
-
-                        elif cur_eval > best_eval:
-                            best_eval = cur_eval
-                            best_moves = [(pos_from, pos_to)]
-
-                        gamestate.move(pos_to, pos_from)
-
-        return random.choice(best_moves)
-
-
 class Main():
     def __init__(self):
         self.screen = pygame.display.set_mode((GAMESIZE, GAMESIZE))
         pygame.display.set_caption("Chess")
+        # Mouse motion and the like would wake the event loop for nothing
+        pygame.event.set_allowed(None)
+        pygame.event.set_allowed([pygame.QUIT, pygame.MOUSEBUTTONDOWN, pygame.VIDEOEXPOSE])
 
         self.board = Board(GAMESIZE, PIECE_OFFSET)
-        self.gamestate = GameState()
+        self.gamestate = BitboardGameState()
 
         self.board.draw_gamestate(self.gamestate, self.screen)
 
-        self.opponent = Opponent()
+        # The engine searches in its own process, and keeps searching the
+        # expected reply while the player thinks
+        self.opponent = EngineWorker(time_limit=ENGINE_TIME_LIMIT,
+                                     book=BOOK_PATH if os.path.exists(BOOK_PATH) else None,
+                                     tablebases=TABLEBASE_PATH)
+        self.engine_thinking = False
+        self.ponder_move = None
+
+    def is_game_over(self):
+        if self.gamestate.legal_moves():
+            return False
+        if self.gamestate.in_check():
+            log.info('Checkmate!')
+        else:
+            log.info('Stalemate!')
+        return True
+
+    def start_engine(self, player_move):
+        if self.ponder_move is not None and player_move == self.ponder_move:
+            self.opponent.ponderhit()
+        else:
+            self.opponent.start_search(self.gamestate)
+        self.ponder_move = None
+        self.engine_thinking = True
+
+    def play_engine_move(self):
+        move, info, hit_rate = self.opponent.result
+        self.engine_thinking = False
+        self.gamestate.make_move(move)
+        translate_move(*move_to_positions(move))
+        log.debug('depth %d score %d nodes %d nps %.0f time %.2fs tt hits %.0f%%',
+                  info.depth, info.score, info.nodes, info.nps, info.time, hit_rate * 100)
+
+        # Ponder on the reply the search expects
+        if len(info.pv) > 1 and info.pv[0] == move and info.pv[1] in self.gamestate.legal_moves():
+            self.ponder_move = info.pv[1]
+            self.gamestate.make_move(self.ponder_move)
+            self.opponent.start_search(self.gamestate, ponder=True)
+            self.gamestate.unmake_move()
 
     def run(self):
         first_click = True
         pos_from, pos_to = False, False
-        is_in_check = False
+        game_over = False
+
+        clock = pygame.time.Clock()
 
         while True:
-            for event in pygame.event.get():
-                if event.type == pygame.MOUSEBUTTONDOWN:
+            # Block until there is input instead of polling, then drain the
+            # queue so a burst of events costs one frame. While the engine
+            # thinks, wake up at the frame rate to check for its move.
+            if self.engine_thinking:
+                events = [pygame.event.wait(1000 // MAX_FPS)] + pygame.event.get()
+            else:
+                events = [pygame.event.wait()] + pygame.event.get()
+            for event in events:
+                if event.type == pygame.QUIT:
+                    self.opponent.close()
+                    pygame.quit()
+                    return
+
+                if event.type == pygame.VIDEOEXPOSE:
+                    self.board.invalidate()
+                    self.board.draw_gamestate(self.gamestate, self.screen)
+
+                if event.type == pygame.MOUSEBUTTONDOWN and not game_over:
+                    if self.engine_thinking:
+                        log.info('Not your Turn')
+                        continue
+
                     if first_click:
                         pos_from = pos_to_index(pygame.mouse.get_pos())
                         piece = self.gamestate.get_piece_type(pos_from)
@@ -99,14 +131,16 @@ class Main():
                             continue
 
                         if piece.color != self.gamestate.current_turn_color:
-                            print('Not your Turn')
+                            log.info('Not your Turn')
                             pos_from = False
                             continue
 
-                        valid_moves = piece.get_valid_moves(pos_from, self.gamestate)
+                        # Only legal moves are offered, so pinned pieces
+                        # stay put and a check has to be answered
+                        valid_moves = self.gamestate.legal_targets(pos_from)
 
-                        if valid_moves.size > 0:
-                            highlight_coordinates(self.screen, valid_moves)
+                        if valid_moves:
+                            self.board.draw_gamestate(self.gamestate, self.screen, valid_moves)
 
                         first_click = False
 
@@ -116,52 +150,31 @@ class Main():
                         first_click = True
 
             if pos_from and pos_to and pos_from != pos_to:
-                pos_to = np.array(pos_to)
-                if any(np.array_equal(np.array(pos_to), move) for move in valid_moves):
-                    self.gamestate.move(pos_from, pos_to)
-
-                    is_illegal_king_move = False
-                    if isinstance(piece, King):
-                        is_illegal_king_move = detect_if_in_check(
-                            self.gamestate, self.gamestate.current_turn_color)
-
-                    is_still_in_check = False
-                    if is_in_check:
-
-                        # Missing checkmate logic (i.e detect if checkmate)
-                        is_still_in_check = detect_if_in_check(
-                            self.gamestate, self.gamestate.current_turn_color)
-
-                    if is_illegal_king_move or is_still_in_check:
-                        # if piece is still in check, revert back.
-                        if is_still_in_check:
-                            print("Invalid Move! Still in check!")
-                        elif is_illegal_king_move:
-                            print("That square is covered by oppenent!")
-
-                        # Undo move
-                        self.gamestate.move(pos_to, pos_from)
-                        self.board.draw_gamestate(self.gamestate, self.screen)
-                        pos_from, pos_to = False, False
-                        continue
+                player_move = valid_moves.get(pos_to)
+                if player_move is not None:
+                    self.gamestate.make_move(player_move)
 
-                    is_in_check = False
-
-                    # other_color = opposite_color(self.gamestate.current_turn_color)
-                    self.board.draw_gamestate(self.gamestate, self.screen)
-
-                    opponent_from, opponent_to = self.opponent.find_move(self.gamestate)
-                    self.gamestate.move(opponent_from, opponent_to)
-                    translate_move(opponent_from, opponent_to)
-                    is_in_check = detect_if_in_check(self.gamestate, 'w')
+                    game_over = self.is_game_over()
+                    if not game_over:
+                        self.start_engine(player_move)
 
                 else:
-                    print('Invalid Move!')
+                    log.info('Invalid Move!')
 
                 self.board.draw_gamestate(self.gamestate, self.screen)
                 pos_from, pos_to = False, False
 
+            if self.engine_thinking and self.opponent.poll() is not None:
+                self.play_engine_move()
+                self.board.draw_gamestate(self.gamestate, self.screen)
+                game_over = self.is_game_over()
+                if not game_over and detect_if_in_check(self.gamestate, 'w'):
+                    log.info('Check')
+
+            clock.tick(MAX_FPS)
+
 
 if __name__ == '__main__':
+    logging.basicConfig(level=LOG_LEVEL, format='%(message)s')
     main = Main()
     main.run()
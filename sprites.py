@@ -0,0 +1,23 @@
+import pygame
+
+COLORS = ('w', 'b')
+PIECE_CHARS = ('K', 'Q', 'R', 'N', 'B', 'p')
+
+# Loaded sprites keyed by (color, char). Filled lazily since convert_alpha()
+# needs an initialized display.
+_sprites = {}
+
+
+def get_sprite(color, char):
+    sprite = _sprites.get((color, char))
+    if sprite is None:
+        sprite = pygame.image.load(f'graph/{color}{char}.png').convert_alpha()
+        _sprites[(color, char)] = sprite
+    return sprite
+
+
+def load_sprites():
+    for color in COLORS:
+        for char in PIECE_CHARS:
+            get_sprite(color, char)
+    return _sprites